@@ -0,0 +1,224 @@
+"""
+Sales rollups for the admin reports
+
+update() folds orders placed since its watermark into two summary tables:
+sales_daily (one row per day: orders, units, revenue) and
+sales_daily_product (one row per day and product, with the product's
+category at the time). Cancelled orders are left out, and cancelling or
+reinstating an order that was already rolled up moves it out of or back
+into its rows (record_status_change, called from the Order update event and
+by routes that change the status with a Core UPDATE).
+report() reads the rows of a date range as columns and groups them by
+week, category or product in memory, with NumPy when it is installed, so
+reports never touch the order tables.
+"""
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+WATERMARK = 'sales_rollup'
+METRICS = ('orders', 'units', 'revenue')
+
+
+def group_sum(keys, columns):
+    """(sorted distinct keys, [per-key sum of each column])"""
+    if not keys:
+        return [], [[] for _ in columns]
+    if np is None:
+        totals = {}
+        for i, key in enumerate(keys):
+            row = totals.setdefault(key, [0] * len(columns))
+            for c, column in enumerate(columns):
+                row[c] += column[i]
+        distinct = sorted(totals)
+        return distinct, [[totals[key][c] for key in distinct] for c in range(len(columns))]
+    distinct, inverse = np.unique(np.asarray(keys), return_inverse=True)
+    return distinct.tolist(), [np.bincount(inverse, weights=np.asarray(column, dtype=np.float64)).tolist()
+                               for column in columns]
+
+
+def as_date(value):
+    # SQLite returns date() as text
+    return datetime.strptime(value, '%Y-%m-%d').date() if isinstance(value, str) else value
+
+
+class SalesRollup:
+    def __init__(self, db, order_model, item_model, product_model, daily_model, product_daily_model,
+                 watermark_model, excluded_statuses=('Cancelled',), batch_orders=5000, settle_seconds=30):
+        self.db = db
+        self.Order = order_model
+        self.OrderItem = item_model
+        self.Product = product_model
+        self.Daily = daily_model
+        self.ProductDaily = product_daily_model
+        self.Watermark = watermark_model
+        self.excluded_statuses = tuple(excluded_statuses)
+        self.batch_orders = batch_orders
+        # See CoPurchaseIndex.settle_seconds
+        self.settle_seconds = settle_seconds
+
+    def _insert(self, model, dialect):
+        return (postgresql if dialect == 'postgresql' else sqlite).insert(model.__table__)
+
+    def _add(self, connection, model, keys, rows):
+        """Add rows of metric deltas to model, creating the rows that do not exist yet"""
+        if not rows:
+            return
+        stmt = self._insert(model, connection.dialect.name)
+        table = model.__table__
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + stmt.excluded[name]
+                  for name in rows[0] if name not in keys and name in METRICS}
+        )
+        connection.execute(stmt, rows)
+
+    def _watermark(self, connection):
+        connection.execute(self._insert(self.Watermark, connection.dialect.name)
+                           .values(name=WATERMARK, last_id=0)
+                           .on_conflict_do_nothing(index_elements=['name']))
+        return connection.execute(
+            select(self.Watermark.last_id).where(self.Watermark.name == WATERMARK)
+        ).scalar_one()
+
+    def _lines(self, connection, orders):
+        """Per (day, product) totals of the order lines of the orders selected by `orders`"""
+        Order, OrderItem, Product = self.Order, self.OrderItem, self.Product
+        day = func.date(Order.created_at)
+        return connection.execute(
+            select(day, OrderItem.product_id, Product.category_id,
+                   func.count(func.distinct(Order.id)), func.sum(OrderItem.quantity),
+                   func.sum(OrderItem.quantity * OrderItem.price))
+            .join(Order, Order.id == OrderItem.order_id)
+            .outerjoin(Product, Product.id == OrderItem.product_id)
+            .where(orders)
+            .group_by(day, OrderItem.product_id, Product.category_id)
+        ).all()
+
+    def _apply(self, connection, lines, daily, sign=1):
+        """Add (or with sign=-1 remove) _lines() output and per-day order totals"""
+        units = {}
+        for day, _, _, _, quantity, _ in lines:
+            units[as_date(day)] = units.get(as_date(day), 0) + quantity
+        self._add(connection, self.Daily, ('day',), [
+            {'day': as_date(day), 'orders': sign * orders, 'units': sign * units.get(as_date(day), 0),
+             'revenue': sign * (revenue or 0)}
+            for day, orders, revenue in daily
+        ])
+        self._add(connection, self.ProductDaily, ('day', 'product_id'), [
+            {'day': as_date(day), 'product_id': product_id, 'category_id': category_id,
+             'orders': sign * orders, 'units': sign * quantity, 'revenue': sign * (revenue or 0)}
+            for day, product_id, category_id, orders, quantity, revenue in lines
+        ])
+
+    def update(self, full=False):
+        """Fold settled orders past the watermark into the rollups; returns the number of orders read"""
+        Order, Watermark, session = self.Order, self.Watermark, self.db.session
+        connection = session.connection()
+        if full:
+            session.execute(self.Daily.__table__.delete())
+            session.execute(self.ProductDaily.__table__.delete())
+            session.execute(Watermark.__table__.delete().where(Watermark.name == WATERMARK))
+        last_id = self._watermark(connection)
+        session.commit()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.settle_seconds)
+        read = 0
+        while True:
+            batch = select(Order.id).where(Order.id > last_id, Order.created_at <= cutoff) \
+                .order_by(Order.id).limit(self.batch_orders)
+            batch_end, count = session.execute(
+                select(func.max(Order.id), func.count(Order.id)).where(Order.id.in_(batch))
+            ).one()
+            if batch_end is None:
+                break
+            # Claim the batch first: a concurrent run that moved the watermark already owns it
+            claimed = session.execute(
+                update(Watermark)
+                .where(Watermark.name == WATERMARK, Watermark.last_id == last_id)
+                .values(last_id=batch_end, updated_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not claimed:
+                session.rollback()
+                break
+            orders = (Order.id > last_id) & (Order.id <= batch_end) & (Order.created_at <= cutoff) \
+                & Order.status.notin_(self.excluded_statuses)
+            connection = session.connection()
+            day = func.date(Order.created_at)
+            daily = connection.execute(
+                select(day, func.count(Order.id), func.sum(Order.total_amount)).where(orders).group_by(day)
+            ).all()
+            self._apply(connection, self._lines(connection, orders), daily)
+            session.commit()
+            read += count
+            last_id = batch_end
+        return read
+
+    def record_status_change(self, connection, order, old_status, new_status):
+        """Take a cancelled order out of the rollups, or put a reinstated one back, if it was already rolled up"""
+        was_counted = old_status not in self.excluded_statuses
+        if was_counted == (new_status not in self.excluded_statuses):
+            return
+        # FOR UPDATE waits for an update() that has claimed a batch, so we see whether it covers this order
+        watermark = connection.execute(
+            select(self.Watermark.last_id).where(self.Watermark.name == WATERMARK).with_for_update()
+        ).scalar()
+        if watermark is None or order.id > watermark:
+            # Not read yet; update() will see the new status
+            return
+        sign = -1 if was_counted else 1
+        lines = self._lines(connection, self.Order.id == order.id)
+        daily = [(order.created_at.date(), 1, order.total_amount)]
+        self._apply(connection, lines, daily, sign)
+
+    def report(self, start, end, period='day', limit=10):
+        """Totals between start and end (inclusive) per day or week, and the top categories and products"""
+        Daily, ProductDaily, session = self.Daily, self.ProductDaily, self.db.session
+        rows = session.execute(
+            select(Daily.day, Daily.orders, Daily.units, Daily.revenue)
+            .where(Daily.day >= start, Daily.day <= end).order_by(Daily.day)
+        ).all()
+        days, orders, units, revenue = (list(column) for column in zip(*rows)) if rows else ([], [], [], [])
+        days = [as_date(d) for d in days]
+        if period == 'week':
+            keys = [(d - timedelta(days=d.weekday())).toordinal() for d in days]
+        else:
+            keys = [d.toordinal() for d in days]
+        periods, (orders, units, revenue) = group_sum(keys, [orders, units, revenue])
+        series = [
+            {'period': date.fromordinal(int(p)), 'orders': int(o), 'units': int(u), 'revenue': r}
+            for p, o, u, r in zip(periods, orders, units, revenue)
+        ]
+
+        rows = session.execute(
+            select(ProductDaily.product_id, ProductDaily.category_id,
+                   ProductDaily.orders, ProductDaily.units, ProductDaily.revenue)
+            .where(ProductDaily.day >= start, ProductDaily.day <= end)
+        ).all()
+        columns = [list(column) for column in zip(*rows)] if rows else [[], [], [], [], []]
+        product_ids, category_ids, product_metrics = columns[0], columns[1], columns[2:]
+
+        def top(keys, metrics):
+            distinct, sums = group_sum(keys, metrics)
+            names = METRICS[-len(sums):]
+            totals = [{'id': int(key), **{name: value if name == 'revenue' else int(value)
+                                          for name, value in zip(names, values)}}
+                      for key, *values in zip(distinct, *sums)]
+            totals.sort(key=lambda row: row['revenue'], reverse=True)
+            return totals[:limit]
+
+        # An order with two products of a category is one order but two product rows, so categories get units only
+        return {
+            'series': series,
+            'totals': {'orders': sum(s['orders'] for s in series), 'units': sum(s['units'] for s in series),
+                       'revenue': sum(s['revenue'] for s in series)},
+            'categories': top([c if c is not None else 0 for c in category_ids], product_metrics[1:]),
+            'products': top(product_ids, product_metrics),
+        }
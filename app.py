@@ -1,10 +1,32 @@
+import io
+import json
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+import time
+import click
+from flask import Flask, render_template, request, redirect, url_for, session, flash, abort, g, Response, stream_with_context, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import column_property, joinedload, selectinload
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
 from functools import wraps
-from datetime import datetime
+from collections import namedtuple, defaultdict
+from datetime import datetime, timedelta
+from search import create_search_backend
+from cache import CatalogCache, LRUStore, MISSING, create_shared_store
+from cart_store import create_cart_store
+from jobs import JobQueue, wait_for as wait_for_workers
+from images import ImagePipeline
+from assets import AssetManifest, StaticFiles, build as build_static_assets
+from export import FORMATS as EXPORT_FORMATS, gzip_chunks
+from catalog_import import ProductImporter, read_rows, detect_format
+import migrations
+import query_plans
+from engine_config import load_settings as load_db_settings, engine_options, install_engine_events, pool_metrics
+from profiling import RequestProfiler, render_prometheus
+from fragments import FragmentCacheExtension
+from replicas import ReplicaRouter, RoutingSession, replica_urls
+from recommendations import CoPurchaseIndex
+from analytics import SalesRollup
+from inventory import InventoryForecast
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here-change-in-production')
@@ -17,12 +39,117 @@ if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres://'):
     app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace('postgres://', 'postgresql://', 1)
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Connection pool tuning from DB_CONFIG_FILE / DB_* environment variables (see engine_config.py)
+DB_SETTINGS = load_db_settings()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], DB_SETTINGS)
+
+# Read replicas (comma-separated URLs): read-only views send their SELECTs there, see replicas.py
+app.config['SQLALCHEMY_BINDS'] = {
+    name: {'url': url, **engine_options(url, DB_SETTINGS)}
+    for name, url in replica_urls(os.environ.get('DATABASE_REPLICA_URLS', '')).items()
+}
+app.config['REPLICA_MAX_LAG'] = float(os.environ.get('REPLICA_MAX_LAG', 5))
+app.config['REPLICA_STICKY_SECONDS'] = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+# Catalog cache: in-process LRU plus an optional shared tier (redis://... or memory://)
+app.config['CATALOG_CACHE_TTL'] = int(os.environ.get('CATALOG_CACHE_TTL', 60))
+app.config['CATALOG_CACHE_SIZE'] = int(os.environ.get('CATALOG_CACHE_SIZE', 4096))
+# Cache rendered {% cache %} template fragments (product cards, category grid) in the catalog cache
+app.config['FRAGMENT_CACHE'] = os.environ.get('FRAGMENT_CACHE', '1') != '0'
+app.config['CATALOG_CACHE_URL'] = os.environ.get('CATALOG_CACHE_URL', '')
+# Without a shared tier, invalidations reach the other workers on this host through this file's mtime
+app.config['CATALOG_CACHE_VERSION_FILE'] = os.environ.get(
+    'CATALOG_CACHE_VERSION_FILE', os.path.join(app.instance_path, 'catalog_cache.version'))
+
+# Product listing totals are approximate: cached per filter combination and capped (see PRODUCT_COUNT_CAP)
+app.config['PRODUCT_COUNT_TTL'] = int(os.environ.get('PRODUCT_COUNT_TTL', 300))
+
+# Cart storage: '' keeps carts in the cart table only; memory:// or redis://... holds them there and writes back
+app.config['CART_STORE_URL'] = os.environ.get('CART_STORE_URL', '')
+app.config['CART_FLUSH_INTERVAL'] = int(os.environ.get('CART_FLUSH_INTERVAL', 5))
+
+# Outgoing mail (sent only from background jobs); without MAIL_SERVER messages are rendered but not sent
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'localhost')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 25))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', '').lower() in ('1', 'true', 'yes')
+app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
+app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
+app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@grocery.com')
+app.config['MAIL_SUPPRESS_SEND'] = not os.environ.get('MAIL_SERVER')
+app.config['STORE_ALERT_EMAIL'] = os.environ.get('STORE_ALERT_EMAIL', '')
+
+# Reorder suggestions: supplier lead time, and how many days of demand a reorder should cover beyond it
+app.config['REORDER_LEAD_TIME_DAYS'] = int(os.environ.get('REORDER_LEAD_TIME_DAYS', 7))
+app.config['REORDER_COVER_DAYS'] = int(os.environ.get('REORDER_COVER_DAYS', 14))
+
+# Background jobs run in `flask jobs-worker`; set JOB_WORKER_THREADS to also run them inside each web process
+app.config['JOB_WORKER_THREADS'] = int(os.environ.get('JOB_WORKER_THREADS', 0))
 
-db = SQLAlchemy(app)
+# How long a worker may trust a cached login identity before re-reading the user row
+app.config['PRINCIPAL_CACHE_TTL'] = int(os.environ.get('PRINCIPAL_CACHE_TTL', 30))
+
+# SQL profiling: statements slower than this are logged; /metrics requires METRICS_TOKEN as a bearer token,
+# or without one only answers loopback clients
+app.config['SLOW_QUERY_MS'] = int(os.environ.get('SLOW_QUERY_MS', 200))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+# Directory shared by the gunicorn workers so /metrics can add up every worker's request counters
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', '')
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+IMAGE_WIDTHS = (200, 400, 800)
+ORDER_STATUSES = ['Pending', 'Processing', 'Shipped', 'Delivered', 'Cancelled']
+ADMIN_ORDERS_PER_PAGE = 50
+MY_ORDERS_PER_PAGE = 10
+ORDER_SUMMARY_ITEMS = 3
+PRODUCTS_PER_PAGE = 24
+API_ORDERS_PER_PAGE = 20
+API_BATCH_LIMIT = 100
+PRODUCT_COUNT_CAP = 10000
+# sort name -> (Product column, descending, parser for the cursor value)
+PRODUCT_SORTS = {
+    'newest': ('created_at', True, datetime.fromisoformat),
+    'price_asc': ('price', False, float),
+    'price_desc': ('price', True, float),
+    'name': ('name', False, str),
+}
+EXPORT_BATCH_SIZE = 1000
+LOW_STOCK_THRESHOLD = 10
+RELATED_PRODUCTS = 4
+# New orders reach the co-purchase index and sales rollups in one job each per this many seconds of checkouts
+ORDER_INDEX_BATCH_SECONDS = 60
+SALES_REPORT_RANGES = (7, 30, 90, 365)
+REORDER_SUGGESTIONS_PER_PAGE = 50
+
+replica_router = ReplicaRouter(max_lag=app.config['REPLICA_MAX_LAG'],
+                               sticky_seconds=app.config['REPLICA_STICKY_SECONDS'])
+db = SQLAlchemy(app, session_options={'class_': RoutingSession, 'router': replica_router})
+profiler = RequestProfiler(slow_query_ms=app.config['SLOW_QUERY_MS'], snapshot_dir=app.config['METRICS_DIR'] or None)
+with app.app_context():
+    for engine in db.engines.values():
+        install_engine_events(engine, DB_SETTINGS)
+    profiler.init_app(app, *db.engines.values())
+    replica_router.init_app(app, db)
+_search_backend = None
+catalog_cache = CatalogCache(
+    local=LRUStore(app.config['CATALOG_CACHE_SIZE']),
+    shared=create_shared_store(app.config['CATALOG_CACHE_URL']),
+    ttl=app.config['CATALOG_CACHE_TTL'],
+    # Misses load from the primary: a lagging replica would re-cache what an admin change just invalidated
+    load_context=replica_router.primary,
+    version_file=app.config['CATALOG_CACHE_VERSION_FILE']
+)
+principal_cache = LRUStore(maxsize=10000)
+app.jinja_env.add_extension(FragmentCacheExtension)
+app.jinja_env.fragment_cache = catalog_cache if app.config['FRAGMENT_CACHE'] else None
+image_pipeline = ImagePipeline(app.config['UPLOAD_FOLDER'], IMAGE_WIDTHS, url_prefix=f'{app.static_url_path}/uploads/')
+app.add_template_global(image_pipeline.sources, 'image_sources')
+asset_manifest = AssetManifest(app.static_folder)
+asset_manifest.init_app(app)
+# Static files are answered before Flask's request handling (sessions, profiling, DB hooks)
+app.wsgi_app = StaticFiles(app.wsgi_app, app.static_folder, app.static_url_path)
 
 # ============================================
 # MODELS
@@ -50,6 +177,7 @@ class Category(db.Model):
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    sku = db.Column(db.String(64), unique=True, index=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     price = db.Column(db.Float, nullable=False)
@@ -58,6 +186,13 @@ class Product(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_product_active_category', 'is_active', 'category_id'),
+        db.Index('ix_product_active_created', 'is_active', 'created_at', 'id'),
+        db.Index('ix_product_active_price', 'is_active', 'price', 'id'),
+        db.Index('ix_product_active_name', 'is_active', 'name', 'id'),
+    )
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -65,14 +200,29 @@ class Order(db.Model):
     total_amount = db.Column(db.Float, nullable=False)
     shipping_address = db.Column(db.Text, nullable=False)
     payment_method = db.Column(db.String(50), nullable=False)
-    status = db.Column(db.String(50), default='Pending')
+    # active_history loads the old status even on an expired order, so the update listener always sees the change
+    status = column_property(db.Column(db.String(50), default='Pending'), active_history=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Written at checkout so order lists need no item or product loads
+    item_count = db.Column(db.Integer)
+    item_summary = db.Column(db.Text)
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_order_user_created', 'user_id', 'created_at'),
+        db.Index('ix_order_status_created', 'status', 'created_at'),
+        db.Index('ix_order_created', 'created_at', 'id'),
+    )
+    
+    @property
+    def summary_items(self):
+        """The first ORDER_SUMMARY_ITEMS lines as {'name', 'image'} dicts"""
+        return json.loads(self.item_summary) if self.item_summary else []
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
     product = db.relationship('Product', backref='order_items')
@@ -89,12 +239,641 @@ class Cart(db.Model):
     
     __table_args__ = (db.UniqueConstraint('user_id', 'product_id'),)
 
+class StoreStat(db.Model):
+    """Running counters for the admin dashboard, e.g. 'orders', 'orders:Pending', 'revenue:Pending'"""
+    __tablename__ = 'store_stats'
+    name = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Float, nullable=False, default=0)
+
+class DailyOrderStat(db.Model):
+    __tablename__ = 'daily_order_stats'
+    day = db.Column(db.Date, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+class ProductPair(db.Model):
+    """How many orders contained both products; kept for both orderings of each pair"""
+    __tablename__ = 'product_pair'
+    product_id = db.Column(db.Integer, primary_key=True)
+    other_id = db.Column(db.Integer, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+
+class ProductRecommendation(db.Model):
+    """A product's top co-purchased product ids as a JSON list, best first"""
+    __tablename__ = 'product_recommendation'
+    product_id = db.Column(db.Integer, primary_key=True)
+    related = db.Column(db.Text, nullable=False, default='[]')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class IndexWatermark(db.Model):
+    """How far an incremental index has read its source table, e.g. 'co_purchase' -> last order id"""
+    __tablename__ = 'index_watermark'
+    name = db.Column(db.String(100), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SalesDaily(db.Model):
+    """Orders, units and revenue per day, cancelled orders excluded (see analytics.py)"""
+    __tablename__ = 'sales_daily'
+    day = db.Column(db.Date, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+class SalesDailyProduct(db.Model):
+    """Orders containing a product, its units and its revenue per day"""
+    __tablename__ = 'sales_daily_product'
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    category_id = db.Column(db.Integer)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+class ReorderSuggestion(db.Model):
+    """A product forecast to run short, from the last inventory forecast run (see inventory.py)"""
+    __tablename__ = 'reorder_suggestion'
+    product_id = db.Column(db.Integer, primary_key=True)
+    stock = db.Column(db.Integer, nullable=False)
+    velocity = db.Column(db.Float, nullable=False)
+    recent_velocity = db.Column(db.Float, nullable=False)
+    days_of_cover = db.Column(db.Float, nullable=False)
+    stockout_date = db.Column(db.Date, nullable=False)
+    reorder_point = db.Column(db.Float, nullable=False)
+    suggested_quantity = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+    product = db.relationship('Product', primaryjoin='ReorderSuggestion.product_id == Product.id',
+                              foreign_keys=[product_id], viewonly=True)
+    
+    __table_args__ = (db.Index('ix_reorder_suggestion_cover', 'days_of_cover', 'product_id'),)
+
+class BackgroundJob(db.Model):
+    """Durable job queue row, see jobs.py"""
+    __tablename__ = 'background_job'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    idempotency_key = db.Column(db.String(200), unique=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    locked_by = db.Column(db.String(200))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (db.Index('ix_background_job_status_run_at', 'status', 'run_at'),)
+
+job_queue = JobQueue(db, BackgroundJob)
+co_purchase_index = CoPurchaseIndex(db, Order, OrderItem, ProductPair, ProductRecommendation, IndexWatermark,
+                                    top_n=2 * RELATED_PRODUCTS)
+sales_rollup = SalesRollup(db, Order, OrderItem, Product, SalesDaily, SalesDailyProduct, IndexWatermark)
+inventory_forecast = InventoryForecast(db, Product, SalesDailyProduct, ReorderSuggestion,
+                                       lead_time_days=app.config['REORDER_LEAD_TIME_DAYS'],
+                                       cover_days=app.config['REORDER_COVER_DAYS'])
+
+with app.app_context():
+    cart_store = create_cart_store(app.config['CART_STORE_URL'], db, Cart, Product, app.config['CART_FLUSH_INTERVAL'])
+
+# ============================================
+# STORE STATS
+# ============================================
+COUNTED_MODELS = {User: 'users', Product: 'products', Category: 'categories'}
+
+def bump_stats(connection, deltas):
+    """Add {name: delta} to store_stats inside the caller's transaction"""
+    table = StoreStat.__table__
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        updated = connection.execute(
+            table.update().where(table.c.name == name).values(value=table.c.value + delta)
+        ).rowcount
+        if not updated:
+            connection.execute(table.insert().values(name=name, value=delta))
+
+def bump_daily_stats(connection, day, orders, revenue):
+    table = DailyOrderStat.__table__
+    updated = connection.execute(
+        table.update().where(table.c.day == day)
+        .values(orders=table.c.orders + orders, revenue=table.c.revenue + revenue)
+    ).rowcount
+    if not updated:
+        connection.execute(table.insert().values(day=day, orders=orders, revenue=revenue))
+
+def record_order_status_change(connection, amount, old_status, new_status):
+    """Move an order's count and revenue from one status bucket to another"""
+    if old_status == new_status:
+        return
+    bump_stats(connection, {
+        f'orders:{old_status}': -1, f'revenue:{old_status}': -amount,
+        f'orders:{new_status}': 1, f'revenue:{new_status}': amount
+    })
+
+def _count_inserted(mapper, connection, target):
+    bump_stats(connection, {COUNTED_MODELS[mapper.class_]: 1})
+
+def _count_deleted(mapper, connection, target):
+    bump_stats(connection, {COUNTED_MODELS[mapper.class_]: -1})
+
+for _model in COUNTED_MODELS:
+    db.event.listen(_model, 'after_insert', _count_inserted)
+    db.event.listen(_model, 'after_delete', _count_deleted)
+
+@db.event.listens_for(Order, 'after_insert')
+def _order_inserted(mapper, connection, order):
+    bump_stats(connection, {'orders': 1, f'orders:{order.status}': 1, f'revenue:{order.status}': order.total_amount})
+    bump_daily_stats(connection, order.created_at.date(), 1, order.total_amount)
+
+@db.event.listens_for(Order, 'after_update')
+def _order_updated(mapper, connection, order):
+    history = db.inspect(order).attrs.status.history
+    if history.deleted and history.added:
+        record_order_status_change(connection, order.total_amount, history.deleted[0], history.added[0])
+        sales_rollup.record_status_change(connection, order, history.deleted[0], history.added[0])
+
+@db.event.listens_for(Order, 'after_delete')
+def _order_deleted(mapper, connection, order):
+    bump_stats(connection, {'orders': -1, f'orders:{order.status}': -1, f'revenue:{order.status}': -order.total_amount})
+    bump_daily_stats(connection, order.created_at.date(), -1, -order.total_amount)
+
+def rebuild_store_stats():
+    """Recompute every dashboard counter from the source tables"""
+    StoreStat.query.delete()
+    DailyOrderStat.query.delete()
+    
+    stats = {name: model.query.count() for model, name in COUNTED_MODELS.items()}
+    stats['orders'] = 0
+    for status, count, revenue in db.session.query(
+            Order.status, db.func.count(Order.id), db.func.sum(Order.total_amount)).group_by(Order.status):
+        stats['orders'] += count
+        stats[f'orders:{status}'] = count
+        stats[f'revenue:{status}'] = revenue or 0
+    db.session.add_all(StoreStat(name=name, value=value) for name, value in stats.items())
+    
+    day = db.func.date(Order.created_at)
+    for order_day, count, revenue in db.session.query(
+            day, db.func.count(Order.id), db.func.sum(Order.total_amount)).group_by(day):
+        if isinstance(order_day, str):
+            order_day = datetime.strptime(order_day, '%Y-%m-%d').date()
+        db.session.add(DailyOrderStat(day=order_day, orders=count, revenue=revenue or 0))
+    
+    db.session.commit()
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Rebuild the admin dashboard counters from scratch"""
+    rebuild_store_stats()
+    print(f"Rebuilt {StoreStat.query.count()} counters and {DailyOrderStat.query.count()} daily rows")
+
+# ============================================
+# BACKGROUND JOBS
+# ============================================
+def send_mail(recipients, subject, template, **context):
+    """Send a plain-text email rendered from templates/emails/; call only from background jobs"""
+    from flask_mail import Mail, Message
+    mail = app.extensions.get('mail') or Mail(app)
+    mail.send(Message(subject, recipients=recipients, body=render_template(f'emails/{template}', **context)))
+
+def alert_recipients():
+    if app.config['STORE_ALERT_EMAIL']:
+        return [app.config['STORE_ALERT_EMAIL']]
+    return [email for (email,) in db.session.query(User.email).filter_by(is_admin=True)]
+
+def enqueue_low_stock_alerts(quantities, order_id):
+    """Queue an alert for each product this order pushed below LOW_STOCK_THRESHOLD"""
+    rows = db.session.execute(
+        db.select(Product.id, Product.stock)
+        .where(Product.id.in_(quantities.keys()), Product.stock < LOW_STOCK_THRESHOLD)
+    ).all()
+    for product_id, stock in rows:
+        if stock + quantities[product_id] >= LOW_STOCK_THRESHOLD:
+            job_queue.enqueue('low_stock', {'product_id': product_id}, key=f'low-stock:{product_id}:{order_id}')
+
+def enqueue_order_index_updates():
+    """Queue one co-purchase and one sales rollup update per ORDER_INDEX_BATCH_SECONDS, run once its orders settled"""
+    now = time.time()
+    window = int(now // ORDER_INDEX_BATCH_SECONDS)
+    delay = (window + 1) * ORDER_INDEX_BATCH_SECONDS + co_purchase_index.settle_seconds - now
+    job_queue.enqueue('co_purchase', key=f'co-purchase:{window}', delay=delay)
+    job_queue.enqueue('sales_rollup', key=f'sales-rollup:{window}', delay=delay)
+
+@job_queue.handler('order_confirmation')
+def send_order_confirmation(payload):
+    order = Order.query.options(
+        joinedload(Order.user), selectinload(Order.items).joinedload(OrderItem.product)
+    ).filter_by(id=payload['order_id']).first()
+    if order and order.user:
+        send_mail([order.user.email], f'Order #{order.id} confirmed', 'order_confirmation.txt', order=order)
+
+@job_queue.handler('order_status')
+def send_order_status(payload):
+    order = Order.query.options(joinedload(Order.user)).filter_by(id=payload['order_id']).first()
+    if order and order.user:
+        send_mail([order.user.email], f"Order #{order.id} is now {payload['status']}", 'order_status.txt',
+                  order=order, status=payload['status'])
+
+@job_queue.handler('low_stock')
+def send_low_stock_alert(payload):
+    product = db.session.get(Product, payload['product_id'])
+    recipients = alert_recipients()
+    if product and recipients:
+        send_mail(recipients, f'Low stock: {product.name}', 'low_stock.txt', product=product)
+
+@job_queue.handler('image_variants')
+def build_image_variants(payload):
+    image_pipeline.build_variants(payload['path'])
+    # Cached pages and card fragments were rendered without the new srcsets
+    catalog_cache.invalidate()
+
+@job_queue.handler('co_purchase')
+def update_co_purchase_index(payload):
+    co_purchase_index.update()
+
+@job_queue.handler('sales_rollup')
+def update_sales_rollup(payload):
+    sales_rollup.update()
+
+@job_queue.handler('inventory_forecast')
+def run_inventory_forecast(payload):
+    # Forecasts read the rollups, so bring them up to date first
+    sales_rollup.update()
+    inventory_forecast.run()
+
+if app.config['JOB_WORKER_THREADS']:
+    @app.before_request
+    def start_job_workers():
+        job_queue.ensure_workers(app, app.config['JOB_WORKER_THREADS'])
+
+@app.cli.command('jobs-worker')
+@click.option('--threads', default=2, show_default=True, help='Jobs handled concurrently.')
+@click.option('--poll', default=1.0, show_default=True, help='Seconds to wait when the queue is empty.')
+@click.option('--once', is_flag=True, help='Handle the jobs that are due now, then exit.')
+def jobs_worker_command(threads, poll, once):
+    """Run background jobs (order emails, stock alerts) until interrupted"""
+    if once:
+        handled = 0
+        while True:
+            batch = job_queue.run_once(f'cli:{os.getpid()}')
+            handled += batch
+            if not batch:
+                break
+        print(f"Handled {handled} job(s)")
+        return
+    print(f"Job worker running with {threads} thread(s); Ctrl-C to stop")
+    wait_for_workers(*job_queue.work(app, threads, poll))
+
+@app.cli.command('prune-jobs')
+@click.option('--days', default=7, show_default=True)
+def prune_jobs_command(days):
+    """Delete completed jobs older than --days"""
+    print(f"Deleted {job_queue.prune(days)} job(s)")
+
+@app.cli.command('build-recommendations')
+@click.option('--full', is_flag=True, help='Recount every order instead of only those since the last run.')
+def build_recommendations_command(full):
+    """Update the "frequently bought together" index from order history"""
+    orders, products = co_purchase_index.update(full=full)
+    print(f"Read {orders} order(s), refreshed recommendations for {products} product(s)")
+
+@app.cli.command('rollup-sales')
+@click.option('--full', is_flag=True, help='Rebuild the rollups from every order instead of only new ones.')
+def rollup_sales_command(full):
+    """Fold new orders into the sales report rollups"""
+    print(f"Rolled up {sales_rollup.update(full=full)} order(s)")
+
+@app.cli.command('forecast-inventory')
+def forecast_inventory_command():
+    """Recompute sales velocity and reorder suggestions for every product (run nightly)"""
+    sales_rollup.update()
+    started = time.perf_counter()
+    stored = inventory_forecast.run()
+    print(f"Stored {stored} reorder suggestion(s) in {time.perf_counter() - started:.1f}s")
+
+@app.cli.command('build-image-variants')
+def build_image_variants_command():
+    """Build resized variants for every uploaded product and category image that lacks them"""
+    paths = {path for model in (Product, Category)
+             for (path,) in db.session.query(model.image).filter(model.image.isnot(None))
+             if image_pipeline.url(path) != path}
+    built = 0
+    for path in sorted(paths):
+        if image_pipeline.manifest(path) is None:
+            try:
+                image_pipeline.build_variants(path)
+                built += 1
+            except (OSError, ValueError) as e:
+                print(f"Skipped {path}: {e}")
+    print(f"Built variants for {built} of {len(paths)} image(s)")
+
 # ============================================
 # HELPER FUNCTIONS
 # ============================================
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def save_image_upload(image_file, folder):
+    """Store an upload under its content hash and queue its resized variants; returns the stored path"""
+    path = image_pipeline.store(image_file, folder)
+    job_queue.enqueue('image_variants', {'path': path}, key=f'image-variants:{path}')
+    return path
+
+def parse_date_arg(name):
+    """Parse a YYYY-MM-DD query string argument, returning None if missing or invalid"""
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return None
+
+def encode_cursor(value, row_id):
+    """Build an opaque keyset cursor from a (sort value, id) pair"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return f"{value}_{row_id}"
+
+def apply_order_filters(query, status=None, date_from=None, date_to=None):
+    """Restrict an Order query or select to a status and an inclusive date range"""
+    if status in ORDER_STATUSES:
+        query = query.filter(Order.status == status)
+    if date_from:
+        query = query.filter(Order.created_at >= date_from)
+    if date_to:
+        query = query.filter(Order.created_at < date_to + timedelta(days=1))
+    return query
+
+def order_export_rows(status=None, date_from=None, date_to=None):
+    """Stream one row per order line (orders without lines get one empty row) via a server-side cursor"""
+    stmt = (
+        db.select(Order.id, Order.created_at, Order.status, Order.user_id, Order.payment_method, Order.total_amount,
+                  OrderItem.id, OrderItem.product_id, Product.name, OrderItem.quantity, OrderItem.price)
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .outerjoin(Product, Product.id == OrderItem.product_id)
+        .order_by(Order.id, OrderItem.id)
+    )
+    stmt = apply_order_filters(stmt, status, date_from, date_to)
+    return db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+def decode_cursor(cursor, parse=datetime.fromisoformat):
+    """Split a keyset cursor back into (sort value, id), or None if malformed"""
+    try:
+        value, row_id = cursor.rsplit('_', 1)
+        return parse(value), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+def serialize_category(category):
+    return {
+        'id': category.id,
+        'name': category.name,
+        'description': category.description,
+        'image': category.image
+    }
+
+def serialize_product(product):
+    """Plain-dict snapshot of a product that templates can use in place of the model"""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description or '',
+        'price': product.price,
+        'stock': product.stock,
+        'image': product.image,
+        'is_active': product.is_active,
+        'category_id': product.category_id,
+        'added_on': product.created_at.strftime('%B %d, %Y') if product.created_at else '',
+        'category': serialize_category(product.category) if product.category else None
+    }
+
+def active_categories():
+    return catalog_cache.get_or_set('categories', lambda: [
+        serialize_category(c) for c in Category.query.filter_by(is_active=True).all()
+    ])
+
+def search_index():
+    """Return the product search backend for the current database, creating it on first use"""
+    global _search_backend
+    if _search_backend is None:
+        _search_backend = create_search_backend(db, Product)
+    return _search_backend
+
+def product_listing(args):
+    """One page of active products for the listing filters in args, with its approximate total"""
+    category_id = args.get('category', type=int)
+    search = args.get('search', '').strip()
+    min_price = args.get('min_price', type=float)
+    max_price = args.get('max_price', type=float)
+    in_stock = args.get('in_stock') == '1'
+    sort = args.get('sort') or ('relevance' if search else 'newest')
+    if sort not in PRODUCT_SORTS and not (sort == 'relevance' and search):
+        sort = 'newest'
+    cursor = args.get('cursor', '')
+    
+    def filtered(ranked=False):
+        query = Product.query.filter_by(is_active=True)
+        if category_id:
+            query = query.filter_by(category_id=category_id)
+        if min_price is not None:
+            query = query.filter(Product.price >= min_price)
+        if max_price is not None:
+            query = query.filter(Product.price <= max_price)
+        if in_stock:
+            query = query.filter(Product.stock > 0)
+        if search:
+            query = search_index().apply(query, search, ranked=ranked)
+        return query
+    
+    def load_page():
+        if sort == 'relevance':
+            # Search rank is not a column we can seek on; page by offset, bounded like the count
+            offset = min(int(cursor), PRODUCT_COUNT_CAP) if cursor.isdigit() else 0
+            query = filtered(ranked=True).options(joinedload(Product.category)).order_by(Product.id)
+            rows = query.offset(offset).limit(PRODUCTS_PER_PAGE + 1).all()
+            next_cursor = str(offset + PRODUCTS_PER_PAGE)
+        else:
+            attr, descending, parse = PRODUCT_SORTS[sort]
+            column = getattr(Product, attr)
+            query = filtered().options(joinedload(Product.category))
+            after = decode_cursor(cursor, parse) if cursor else None
+            if after:
+                value, row_id = after
+                if descending:
+                    query = query.filter(db.or_(column < value, db.and_(column == value, Product.id < row_id)))
+                else:
+                    query = query.filter(db.or_(column > value, db.and_(column == value, Product.id > row_id)))
+            order = (column.desc(), Product.id.desc()) if descending else (column, Product.id)
+            rows = query.order_by(*order).limit(PRODUCTS_PER_PAGE + 1).all()
+            last = rows[PRODUCTS_PER_PAGE - 1] if len(rows) > PRODUCTS_PER_PAGE else None
+            next_cursor = encode_cursor(getattr(last, attr), last.id) if last else None
+        return {
+            'products': [serialize_product(p) for p in rows[:PRODUCTS_PER_PAGE]],
+            'next_cursor': next_cursor if len(rows) > PRODUCTS_PER_PAGE else None
+        }
+    
+    def count():
+        capped = filtered().with_entities(Product.id).limit(PRODUCT_COUNT_CAP + 1).subquery()
+        return db.session.query(db.func.count()).select_from(capped).scalar()
+    
+    key = f'products:{category_id}:{search}:{min_price}:{max_price}:{in_stock}'
+    page = catalog_cache.get_or_set(f'{key}:{sort}:{cursor}', load_page)
+    total = catalog_cache.get_or_set(f'{key}:count', count, ttl=app.config['PRODUCT_COUNT_TTL'])
+    
+    filters = {
+        'category': category_id,
+        'search': search or None,
+        'min_price': min_price,
+        'max_price': max_price,
+        'in_stock': '1' if in_stock else None,
+        'sort': sort
+    }
+    return {
+        'products': page['products'],
+        'next_cursor': page['next_cursor'],
+        'is_first_page': not cursor,
+        'total': min(total, PRODUCT_COUNT_CAP),
+        'total_capped': total > PRODUCT_COUNT_CAP,
+        'filters': filters
+    }
+
+def product_detail_entry(product_id):
+    """Cached {'product', 'related'} for an active product, or None"""
+    def load():
+        product = Product.query.filter_by(id=product_id, is_active=True).first()
+        if not product:
+            return None
+        related_products = []
+        related_ids = co_purchase_index.related(product.id)
+        if related_ids:
+            found = {p.id: p for p in Product.query.options(joinedload(Product.category))
+                     .filter(Product.id.in_(related_ids), Product.is_active == True)}
+            related_products = [found[i] for i in related_ids if i in found][:RELATED_PRODUCTS]
+        bought_together = bool(related_products)
+        # Products nobody has bought alongside yet fall back to (or are topped up from) their category
+        if len(related_products) < RELATED_PRODUCTS:
+            related_products += Product.query.filter(
+                Product.category_id == product.category_id,
+                Product.id.notin_([product.id] + [p.id for p in related_products]),
+                Product.is_active == True
+            ).limit(RELATED_PRODUCTS - len(related_products)).all()
+        return {
+            'product': serialize_product(product),
+            'related': [serialize_product(p) for p in related_products],
+            'bought_together': bought_together
+        }
+    
+    return catalog_cache.get_or_set(f'product:{product_id}', load)
+
+def cart_lines(user_id):
+    """[{'product', 'quantity'}, ...] for the user's cart, skipping products that no longer exist"""
+    quantities = cart_store.items(user_id)
+    found = {}
+    if quantities:
+        found = {p.id: p for p in Product.query.options(joinedload(Product.category))
+                 .filter(Product.id.in_(quantities.keys())).all()}
+    return [{'product': found[product_id], 'quantity': quantity}
+            for product_id, quantity in quantities.items() if product_id in found]
+
+def order_summary_values(lines):
+    """item_count/item_summary column values for an order's (product name, image) lines"""
+    return {
+        'item_count': len(lines),
+        'item_summary': json.dumps([{'name': name, 'image': image} for name, image in lines[:ORDER_SUMMARY_ITEMS]])
+    }
+
+def fill_order_summaries(batch_size=1000):
+    """Write the summary columns of orders that lack them (placed before they existed, or seeded)"""
+    filled = 0
+    while True:
+        order_ids = db.session.execute(
+            db.select(Order.id).where(Order.item_count.is_(None)).limit(batch_size)
+        ).scalars().all()
+        if not order_ids:
+            return filled
+        lines = defaultdict(list)
+        for order_id, name, image in db.session.execute(
+            db.select(OrderItem.order_id, Product.name, Product.image)
+            .outerjoin(Product, Product.id == OrderItem.product_id)
+            .where(OrderItem.order_id.in_(order_ids))
+            .order_by(OrderItem.order_id, OrderItem.id)
+        ):
+            lines[order_id].append((name, image))
+        db.session.execute(db.update(Order), [
+            {'id': order_id, **order_summary_values(lines[order_id])} for order_id in order_ids
+        ])
+        db.session.commit()
+        filled += len(order_ids)
+
+def reserve_stock(quantities):
+    """Atomically take {product_id: quantity} out of stock in one conditional UPDATE.
+
+    Every row is only decremented if it still holds enough stock, so concurrent
+    checkouts cannot oversell. Returns False (and changes nothing the caller
+    commits) when any line is short; the caller must roll back.
+    """
+    if not quantities:
+        return True
+    delta = db.case(quantities, value=Product.id)
+    result = db.session.execute(
+        db.update(Product)
+        .where(Product.id.in_(quantities.keys()), Product.stock >= delta)
+        .values(stock=Product.stock - delta)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == len(quantities)
+
+def release_stock(quantities):
+    """Put {product_id: quantity} back into stock in one UPDATE"""
+    if not quantities:
+        return
+    delta = db.case(quantities, value=Product.id)
+    db.session.execute(
+        db.update(Product)
+        .where(Product.id.in_(quantities.keys()))
+        .values(stock=Product.stock + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+Principal = namedtuple('Principal', ['id', 'username', 'is_admin'])
+
+def current_principal():
+    """Identity of the logged-in user, memoised on g and cached per process for PRINCIPAL_CACHE_TTL seconds"""
+    if 'principal' in g:
+        return g.principal
+    
+    principal = None
+    user_id = session.get('user_id')
+    if user_id is not None:
+        principal = principal_cache.get(user_id)
+        if principal is MISSING:
+            row = db.session.query(User.id, User.username, User.is_admin).filter_by(id=user_id).first()
+            principal = Principal(row.id, row.username, bool(row.is_admin)) if row else None
+            principal_cache.set(user_id, principal, app.config['PRINCIPAL_CACHE_TTL'])
+    
+    g.principal = principal
+    return principal
+
+def invalidate_principal(user_id):
+    """Drop a cached identity after the user row changes; other workers catch up within the TTL"""
+    principal_cache.delete(user_id)
+    g.pop('principal', None)
+
+def run_product_import(rows, create_categories=True):
+    """Bulk-upsert products, then bring the search index, catalog cache and counters up to date"""
+    products_before = Product.query.count()
+    result = ProductImporter(db, Product, Category, create_categories=create_categories).run(rows)
+    bump_stats(db.session.connection(), {
+        'products': Product.query.count() - products_before,
+        'categories': result.categories_created
+    })
+    db.session.commit()
+    search_index().rebuild()
+    catalog_cache.invalidate()
+    return result
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -110,8 +889,8 @@ def admin_required(f):
         if 'user_id' not in session:
             flash('Please login first.', 'error')
             return redirect(url_for('login'))
-        user = User.query.get(session['user_id'])
-        if not user or not user.is_admin:
+        principal = current_principal()
+        if not principal or not principal.is_admin:
             flash('Admin access required.', 'error')
             return redirect(url_for('index'))
         return f(*args, **kwargs)
@@ -128,38 +907,35 @@ def page_not_found(e):
 # PUBLIC ROUTES
 # ============================================
 @app.route('/')
+@replica_router.reads
 def index():
     """Homepage route"""
-    categories = Category.query.filter_by(is_active=True).all()
-    products = Product.query.filter_by(is_active=True).limit(8).all()
+    categories = active_categories()
+    products = catalog_cache.get_or_set('index:products', lambda: [
+        serialize_product(p) for p in Product.query.filter_by(is_active=True).limit(8).all()
+    ])
     return render_template('index.html', categories=categories, products=products)
 
 @app.route('/products')
+@replica_router.reads
 def products():
-    """Customer products listing page"""
-    categories = Category.query.filter_by(is_active=True).all()
-    category_id = request.args.get('category', type=int)
-    search = request.args.get('search', '')
-    
-    query = Product.query.filter_by(is_active=True)
-    if category_id:
-        query = query.filter_by(category_id=category_id)
-    if search:
-        query = query.filter(Product.name.contains(search))
-    
-    products_list = query.all()
-    return render_template('products.html', products=products_list, categories=categories, current_category=category_id)
+    """Customer products listing page, keyset-paginated by the chosen sort"""
+    listing = product_listing(request.args)
+    return render_template('products.html', products=listing['products'], categories=active_categories(),
+                           current_category=listing['filters']['category'], filters=listing['filters'],
+                           next_cursor=listing['next_cursor'], is_first_page=listing['is_first_page'],
+                           total=listing['total'], total_capped=listing['total_capped'])
 
 @app.route('/product/<int:id>')
+@replica_router.reads
 def product_detail(id):
     """Single product detail page"""
-    product = Product.query.filter_by(id=id, is_active=True).first_or_404()
-    related_products = Product.query.filter(
-        Product.category_id == product.category_id, 
-        Product.id != product.id,
-        Product.is_active == True
-    ).limit(4).all()
-    return render_template('product_detail.html', product=product, related_products=related_products)
+    entry = product_detail_entry(id)
+    if entry is None:
+        abort(404)
+    product, related_products = entry['product'], entry['related']
+    return render_template('product_detail.html', product=product, related_products=related_products,
+                           bought_together=entry['bought_together'])
 
 # ============================================
 # AUTHENTICATION ROUTES
@@ -206,6 +982,7 @@ def login():
             session['user_id'] = user.id
             session['username'] = user.username
             session['is_admin'] = user.is_admin
+            invalidate_principal(user.id)
             flash('Login successful!', 'success')
             
             if user.is_admin:
@@ -238,6 +1015,7 @@ def profile():
             user.password_hash = generate_password_hash(new_password)
         
         db.session.commit()
+        invalidate_principal(user.id)
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('profile'))
     
@@ -249,18 +1027,8 @@ def profile():
 @app.route('/cart')
 @login_required
 def cart():
-    cart_items = Cart.query.filter_by(user_id=session['user_id']).all()
-    
-    products = []
-    total = 0
-    
-    for item in cart_items:
-        if item.product:
-            products.append({
-                'product': item.product,
-                'quantity': item.quantity
-            })
-            total += item.product.price * item.quantity
+    products = cart_lines(session['user_id'])
+    total = sum(line['product'].price * line['quantity'] for line in products)
     
     return render_template('cart.html', products=products, total=total)
 
@@ -274,21 +1042,7 @@ def add_to_cart(product_id):
         flash(f'Only {product.stock} items available in stock!', 'error')
         return redirect(url_for('product_detail', id=product_id))
     
-    cart_item = Cart.query.filter_by(
-        user_id=session['user_id'],
-        product_id=product_id
-    ).first()
-    
-    if cart_item:
-        cart_item.quantity += quantity
-    else:
-        cart_item = Cart(
-            user_id=session['user_id'],
-            product_id=product_id,
-            quantity=quantity
-        )
-        db.session.add(cart_item)
-    
+    cart_store.add(session['user_id'], {product_id: quantity})
     db.session.commit()
     flash(f'{product.name} added to cart!', 'success')
     return redirect(url_for('cart'))
@@ -298,29 +1052,26 @@ def add_to_cart(product_id):
 def update_cart_quantity(product_id):
     action = request.form.get('action')
     
-    cart_item = Cart.query.filter_by(
-        user_id=session['user_id'],
-        product_id=product_id
-    ).first()
+    quantity = cart_store.items(session['user_id']).get(product_id)
     
-    if not cart_item:
+    if not quantity:
         flash('Item not found in cart.', 'error')
         return redirect(url_for('cart'))
     
     product = Product.query.get_or_404(product_id)
     
     if action == 'increase':
-        if cart_item.quantity < product.stock:
-            cart_item.quantity += 1
+        if quantity < product.stock:
+            cart_store.set(session['user_id'], product_id, quantity + 1)
             flash(f'Quantity increased for {product.name}', 'success')
         else:
             flash(f'Only {product.stock} items available in stock!', 'error')
     elif action == 'decrease':
-        if cart_item.quantity > 1:
-            cart_item.quantity -= 1
+        if quantity > 1:
+            cart_store.set(session['user_id'], product_id, quantity - 1)
             flash(f'Quantity decreased for {product.name}', 'success')
         else:
-            db.session.delete(cart_item)
+            cart_store.remove(session['user_id'], product_id)
             flash(f'{product.name} removed from cart.', 'success')
     
     db.session.commit()
@@ -329,16 +1080,11 @@ def update_cart_quantity(product_id):
 @app.route('/remove_from_cart/<int:product_id>', methods=['POST'])
 @login_required
 def remove_from_cart(product_id):
-    cart_item = Cart.query.filter_by(
-        user_id=session['user_id'],
-        product_id=product_id
-    ).first()
-    
-    if cart_item:
-        product_name = cart_item.product.name
-        db.session.delete(cart_item)
+    if product_id in cart_store.items(session['user_id']):
+        product = db.session.get(Product, product_id)
+        cart_store.remove(session['user_id'], product_id)
         db.session.commit()
-        flash(f'{product_name} removed from cart.', 'success')
+        flash(f'{product.name if product else "Item"} removed from cart.', 'success')
     else:
         flash('Item not found in cart.', 'error')
     
@@ -350,15 +1096,6 @@ def remove_from_cart(product_id):
 @app.route('/checkout', methods=['GET', 'POST'])
 @login_required
 def checkout():
-    cart_items = Cart.query.filter_by(user_id=session['user_id']).all()
-    
-    if not cart_items:
-        flash('Your cart is empty.', 'error')
-        return redirect(url_for('cart'))
-    
-    subtotal = sum(item.product.price * item.quantity for item in cart_items if item.product)
-    total = subtotal + 50
-    
     if request.method == 'POST':
         try:
             shipping_address = request.form.get('shipping_address', '').strip()
@@ -372,29 +1109,51 @@ def checkout():
                 flash('Please select payment method.', 'error')
                 return redirect(url_for('checkout'))
             
+            # Write-behind cart stores move the cart into the table first; the order is built from, and empties, the table
+            cart_store.checkout(session['user_id'])
+            cart_items = Cart.query.options(joinedload(Cart.product)).filter_by(user_id=session['user_id']).all()
+            lines = [item for item in cart_items if item.product]
+            if not lines:
+                flash('Your cart is empty.', 'error')
+                return redirect(url_for('cart'))
+            
+            total = sum(item.product.price * item.quantity for item in lines) + 50
             order = Order(
                 user_id=session['user_id'],
                 total_amount=total,
                 shipping_address=shipping_address,
                 payment_method=payment_method,
-                status='Pending'
+                status='Pending',
+                **order_summary_values([(item.product.name, item.product.image) for item in lines])
             )
+            if not reserve_stock({item.product_id: item.quantity for item in lines}):
+                db.session.rollback()
+                flash('Some items in your cart are no longer available in the requested quantity.', 'error')
+                return redirect(url_for('cart'))
+            
             db.session.add(order)
             db.session.flush()
             
-            for item in cart_items:
-                if item.product:
-                    order_item = OrderItem(
-                        order_id=order.id,
-                        product_id=item.product.id,
-                        quantity=item.quantity,
-                        price=item.product.price
-                    )
-                    db.session.add(order_item)
-                    item.product.stock = max(0, item.product.stock - item.quantity)
+            # Set-based writes: one multi-row INSERT for the lines, one DELETE for the cart
+            db.session.execute(db.insert(OrderItem).values([
+                {
+                    'order_id': order.id,
+                    'product_id': item.product_id,
+                    'quantity': item.quantity,
+                    'price': item.product.price
+                }
+                for item in lines
+            ]))
+            db.session.execute(
+                db.delete(Cart)
+                .where(Cart.user_id == session['user_id'])
+                .execution_options(synchronize_session=False)
+            )
             
-            for item in cart_items:
-                db.session.delete(item)
+            # Mail goes out from the job worker; the jobs commit together with the order
+            job_queue.enqueue('order_confirmation', {'order_id': order.id}, key=f'order-confirmation:{order.id}')
+            enqueue_low_stock_alerts({item.product_id: item.quantity for item in lines}, order.id)
+            enqueue_order_index_updates()
             
             db.session.commit()
             flash('Order placed successfully! Order ID: ' + str(order.id), 'success')
@@ -405,14 +1164,47 @@ def checkout():
             flash('Error processing order. Please try again.', 'error')
             return redirect(url_for('checkout'))
     
+    # Viewing the page reads the cart where it lives and leaves write-behind stores alone
+    cart_items = cart_lines(session['user_id'])
+    if not cart_items:
+        flash('Your cart is empty.', 'error')
+        return redirect(url_for('cart'))
+    
+    subtotal = sum(item['product'].price * item['quantity'] for item in cart_items)
+    total = subtotal + 50
     user = User.query.get(session['user_id'])
     return render_template('checkout.html', cart_items=cart_items, subtotal=subtotal, total=total, user=user)
 
 @app.route('/my_orders')
 @login_required
+@replica_router.reads
 def my_orders():
-    orders = Order.query.filter_by(user_id=session['user_id']).order_by(Order.created_at.desc()).all()
-    return render_template('my_orders.html', orders=orders)
+    """The user's orders newest first, keyset-paginated; line items load only on the detail page"""
+    cursor = decode_cursor(request.args.get('cursor'))
+    query = Order.query.filter_by(user_id=session['user_id'])
+    if cursor:
+        cursor_created_at, cursor_id = cursor
+        query = query.filter(db.or_(
+            Order.created_at < cursor_created_at,
+            db.and_(Order.created_at == cursor_created_at, Order.id < cursor_id)
+        ))
+    orders = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(MY_ORDERS_PER_PAGE + 1).all()
+    
+    next_cursor = None
+    if len(orders) > MY_ORDERS_PER_PAGE:
+        orders = orders[:MY_ORDERS_PER_PAGE]
+        next_cursor = encode_cursor(orders[-1].created_at, orders[-1].id)
+    return render_template('my_orders.html', orders=orders, next_cursor=next_cursor,
+                           is_first_page=cursor is None)
+
+@app.route('/my_orders/<int:order_id>')
+@login_required
+@replica_router.reads
+def order_detail(order_id):
+    order = Order.query.options(
+        selectinload(Order.items).joinedload(OrderItem.product)
+    ).filter_by(id=order_id, user_id=session['user_id']).first_or_404()
+    return render_template('order_detail.html', order=order)
 
 @app.route('/cancel_order/<int:order_id>', methods=['GET', 'POST'])
 @login_required
@@ -428,11 +1220,28 @@ def cancel_order(order_id):
             flash(f'This order cannot be cancelled. Current status: {order.status}', 'error')
             return redirect(url_for('my_orders'))
         
+        # Flip the status conditionally so a double submit cannot restock twice
+        cancelled = db.session.execute(
+            db.update(Order)
+            .where(Order.id == order.id, Order.status == 'Pending')
+            .values(status='Cancelled')
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not cancelled:
+            db.session.rollback()
+            flash('This order has already been updated.', 'error')
+            return redirect(url_for('my_orders'))
+        # A Core UPDATE skips the Order update event, so adjust the counters and rollups here
+        record_order_status_change(db.session.connection(), order.total_amount, 'Pending', 'Cancelled')
+        sales_rollup.record_status_change(db.session.connection(), order, 'Pending', 'Cancelled')
+
+        quantities = {}
         for item in order.items:
-            if item.product:
-                item.product.stock += item.quantity
-        
-        order.status = 'Cancelled'
+            if item.product_id:
+                quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+        release_stock(quantities)
+        job_queue.enqueue('order_status', {'order_id': order.id, 'status': 'Cancelled'},
+                          key=f'order-status:{order.id}:Cancelled')
         db.session.commit()
         
         flash(f'Order #{order.id} has been cancelled successfully.', 'success')
@@ -448,19 +1257,97 @@ def cancel_order(order_id):
 # ============================================
 @app.route('/admin')
 @admin_required
+@replica_router.reads
 def admin_dashboard():
-    total_users = User.query.count()
-    total_products = Product.query.count()
-    total_orders = Order.query.count()
-    total_categories = Category.query.count()
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(5).all()
+    stats = {s.name: s.value for s in StoreStat.query.all()}
+    if not stats:
+        # Counted, written and read back on the primary; a replica would not have the new rows yet
+        with replica_router.primary():
+            rebuild_store_stats()
+            stats = {s.name: s.value for s in StoreStat.query.all()}
+    recent_orders = Order.query.options(joinedload(Order.user)).order_by(Order.created_at.desc()).limit(5).all()
+    daily_orders = DailyOrderStat.query.order_by(DailyOrderStat.day.desc()).limit(14).all()
+    revenue_by_status = [
+        (status, int(stats.get(f'orders:{status}', 0)), stats.get(f'revenue:{status}', 0))
+        for status in ORDER_STATUSES
+    ]
     
     return render_template('admin/dashboard.html', 
-                         total_users=total_users,
-                         total_products=total_products,
-                         total_orders=total_orders,
-                         total_categories=total_categories,
-                         recent_orders=recent_orders)
+                         total_users=int(stats.get('users', 0)),
+                         total_products=int(stats.get('products', 0)),
+                         total_orders=int(stats.get('orders', 0)),
+                         total_categories=int(stats.get('categories', 0)),
+                         revenue_by_status=revenue_by_status,
+                         daily_orders=daily_orders,
+                         recent_orders=recent_orders,
+                         cache_stats=catalog_cache.stats(),
+                         pool_stats=pool_metrics.snapshot())
+
+@app.route('/admin/sales')
+@admin_required
+@replica_router.reads
+def admin_sales():
+    """Sales report over a date range, read from the rollup tables"""
+    days = request.args.get('days', 30, type=int)
+    if days not in SALES_REPORT_RANGES:
+        days = 30
+    period = 'week' if request.args.get('period') == 'week' else 'day'
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=days - 1)
+    report = sales_rollup.report(start, end, period)
+    
+    product_names = dict(db.session.query(Product.id, Product.name)
+                         .filter(Product.id.in_([row['id'] for row in report['products']])))
+    category_names = dict(db.session.query(Category.id, Category.name)
+                          .filter(Category.id.in_([row['id'] for row in report['categories']])))
+    for row in report['products']:
+        row['name'] = product_names.get(row['id'], f"Product #{row['id']}")
+    for row in report['categories']:
+        row['name'] = category_names.get(row['id'], 'Uncategorized')
+    
+    chart = {
+        'labels': [row['period'].strftime('%d %b') for row in report['series']],
+        'revenue': [round(row['revenue'], 2) for row in report['series']],
+        'orders': [row['orders'] for row in report['series']]
+    }
+    return render_template('admin/sales.html', report=report, chart=chart, days=days, period=period,
+                           ranges=SALES_REPORT_RANGES, start=start, end=end)
+
+@app.route('/admin/inventory')
+@admin_required
+@replica_router.reads
+def admin_inventory():
+    """Reorder suggestions from the last forecast run, soonest stockout first"""
+    cursor = decode_cursor(request.args.get('cursor'), parse=float)
+    query = ReorderSuggestion.query.options(joinedload(ReorderSuggestion.product).joinedload(Product.category))
+    if cursor:
+        cursor_cover, cursor_id = cursor
+        query = query.filter(db.or_(
+            ReorderSuggestion.days_of_cover > cursor_cover,
+            db.and_(ReorderSuggestion.days_of_cover == cursor_cover, ReorderSuggestion.product_id > cursor_id)
+        ))
+    suggestions = query.order_by(ReorderSuggestion.days_of_cover, ReorderSuggestion.product_id) \
+        .limit(REORDER_SUGGESTIONS_PER_PAGE + 1).all()
+    
+    next_cursor = None
+    if len(suggestions) > REORDER_SUGGESTIONS_PER_PAGE:
+        suggestions = suggestions[:REORDER_SUGGESTIONS_PER_PAGE]
+        next_cursor = encode_cursor(suggestions[-1].days_of_cover, suggestions[-1].product_id)
+    
+    computed_at = db.session.query(db.func.max(ReorderSuggestion.computed_at)).scalar()
+    return render_template('admin/inventory.html', suggestions=suggestions, next_cursor=next_cursor,
+                           is_first_page=cursor is None, computed_at=computed_at,
+                           lead_time_days=inventory_forecast.lead_time_days,
+                           cover_days=inventory_forecast.cover_days)
+
+@app.route('/admin/inventory/refresh', methods=['POST'])
+@admin_required
+def refresh_inventory_forecast():
+    # One run per quarter hour however often the button is pressed
+    job_queue.enqueue('inventory_forecast', key=f'inventory-forecast:{int(time.time() // 900)}', max_attempts=2)
+    db.session.commit()
+    flash('Forecast queued; suggestions update once the job worker has run it.', 'success')
+    return redirect(url_for('admin_inventory'))
 
 @app.route('/admin/categories')
 @admin_required
@@ -481,15 +1368,12 @@ def add_category():
         if image_url:
             image_filename = image_url
         elif image_file and image_file.filename and allowed_file(image_file.filename):
-            filename = secure_filename(image_file.filename)
-            path = f"categories/{filename}"
-            os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'categories'), exist_ok=True)
-            image_file.save(os.path.join(app.config['UPLOAD_FOLDER'], path))
-            image_filename = path
+            image_filename = save_image_upload(image_file, 'categories')
 
         category = Category(name=name, description=description, image=image_filename)
         db.session.add(category)
         db.session.commit()
+        catalog_cache.invalidate()
 
         flash('Category added successfully!', 'success')
         return redirect(url_for('admin_categories'))
@@ -510,13 +1394,10 @@ def edit_category(category_id):
         if image_url:
             category.image = image_url
         elif image_file and image_file.filename and allowed_file(image_file.filename):
-            filename = secure_filename(image_file.filename)
-            path = f"categories/{filename}"
-            os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'categories'), exist_ok=True)
-            image_file.save(os.path.join(app.config['UPLOAD_FOLDER'], path))
-            category.image = path
+            category.image = save_image_upload(image_file, 'categories')
         
         db.session.commit()
+        catalog_cache.invalidate()
         flash('Category updated successfully!', 'success')
         return redirect(url_for('admin_categories'))
     
@@ -529,6 +1410,7 @@ def toggle_category(category_id):
         category = Category.query.get_or_404(category_id)
         category.is_active = not category.is_active
         db.session.commit()
+        catalog_cache.invalidate()
         
         status = "shown" if category.is_active else "hidden"
         flash(f'Category "{category.name}" is now {status}.', 'success')
@@ -552,6 +1434,7 @@ def delete_category(category_id):
         category_name = category.name
         db.session.delete(category)
         db.session.commit()
+        catalog_cache.invalidate()
         flash(f'Category "{category_name}" deleted successfully!', 'success')
         
     except Exception as e:
@@ -586,11 +1469,7 @@ def add_product():
         if image_url:
             image_filename = image_url
         elif image_file and image_file.filename and allowed_file(image_file.filename):
-            filename = secure_filename(image_file.filename)
-            path = f"products/{filename}"
-            os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'products'), exist_ok=True)
-            image_file.save(os.path.join(app.config['UPLOAD_FOLDER'], path))
-            image_filename = path
+            image_filename = save_image_upload(image_file, 'products')
 
         product = Product(
             name=name,
@@ -601,13 +1480,51 @@ def add_product():
             image=image_filename
         )
         db.session.add(product)
+        db.session.flush()
+        search_index().index_product(product)
         db.session.commit()
+        catalog_cache.invalidate()
 
         flash('Product added successfully!', 'success')
         return redirect(url_for('admin_products'))
 
     return render_template('admin/add_product.html', categories=categories)
 
+@app.route('/admin/import_products', methods=['GET', 'POST'])
+@admin_required
+def import_products():
+    """Bulk upsert products by SKU from an uploaded CSV or JSON Lines file"""
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        fmt = detect_format(upload.filename) if upload and upload.filename else None
+        if not fmt:
+            flash('Please upload a .csv or .jsonl file.', 'error')
+            return redirect(url_for('import_products'))
+        
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig')
+        result = run_product_import(read_rows(stream, fmt), 'create_categories' in request.form)
+        flash(f'Imported {result.upserted} of {result.processed} rows.',
+              'success' if not result.errors else 'warning')
+        return render_template('admin/import_products.html', result=result)
+    
+    return render_template('admin/import_products.html', result=None)
+
+@app.cli.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension')
+@click.option('--create-categories/--no-create-categories', default=True)
+def import_products_command(path, fmt, create_categories):
+    """Bulk upsert products by SKU from a CSV or JSON Lines file"""
+    fmt = fmt or detect_format(path)
+    if not fmt:
+        raise click.UsageError('Cannot tell the file format from its extension; pass --format.')
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        result = run_product_import(read_rows(stream, fmt), create_categories)
+    for line, message in result.errors:
+        click.echo(f'line {line}: {message}', err=True)
+    click.echo(f'Imported {result.upserted} of {result.processed} rows '
+               f'({result.categories_created} new categories, {result.failed} failed)')
+
 @app.route('/admin/edit_product/<int:product_id>', methods=['GET', 'POST'])
 @admin_required
 def edit_product(product_id):
@@ -627,13 +1544,11 @@ def edit_product(product_id):
         if image_url:
             product.image = image_url
         elif image_file and image_file.filename and allowed_file(image_file.filename):
-            filename = secure_filename(image_file.filename)
-            path = f"products/{filename}"
-            os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'products'), exist_ok=True)
-            image_file.save(os.path.join(app.config['UPLOAD_FOLDER'], path))
-            product.image = path
+            product.image = save_image_upload(image_file, 'products')
         
+        search_index().index_product(product)
         db.session.commit()
+        catalog_cache.invalidate()
         flash('Product updated successfully!', 'success')
         return redirect(url_for('admin_products'))
     
@@ -645,7 +1560,9 @@ def toggle_product(product_id):
     try:
         product = Product.query.get_or_404(product_id)
         product.is_active = not product.is_active
+        search_index().index_product(product)
         db.session.commit()
+        catalog_cache.invalidate()
         
         status = "shown" if product.is_active else "hidden"
         flash(f'Product "{product.name}" is now {status}.', 'success')
@@ -669,10 +1586,13 @@ def delete_product(product_id):
             flash(f'Warning: "{product_name}" is in {order_count} order(s). Consider marking as out of stock instead of deleting.', 'warning')
             product.stock = 0
             db.session.commit()
+            catalog_cache.invalidate()
             flash(f'Product "{product_name}" stock set to 0.', 'info')
         else:
             db.session.delete(product)
+            search_index().remove_product(product_id)
             db.session.commit()
+            catalog_cache.invalidate()
             flash(f'Product "{product_name}" deleted successfully!', 'success')
         
     except Exception as e:
@@ -683,15 +1603,87 @@ def delete_product(product_id):
 
 @app.route('/admin/orders')
 @admin_required
+@replica_router.reads
 def admin_orders():
-    orders = Order.query.order_by(Order.created_at.desc()).all()
-    return render_template('admin/orders.html', orders=orders)
+    """Admin order console, keyset-paginated on (created_at, id) newest first"""
+    status = request.args.get('status', '')
+    date_from = parse_date_arg('date_from')
+    date_to = parse_date_arg('date_to')
+    cursor = decode_cursor(request.args.get('cursor'))
+
+    query = Order.query.options(
+        joinedload(Order.user),
+        selectinload(Order.items).joinedload(OrderItem.product)
+    )
+    query = apply_order_filters(query, status, date_from, date_to)
+    if cursor:
+        cursor_created_at, cursor_id = cursor
+        query = query.filter(db.or_(
+            Order.created_at < cursor_created_at,
+            db.and_(Order.created_at == cursor_created_at, Order.id < cursor_id)
+        ))
+
+    orders = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(ADMIN_ORDERS_PER_PAGE + 1).all()
+
+    next_cursor = None
+    if len(orders) > ADMIN_ORDERS_PER_PAGE:
+        orders = orders[:ADMIN_ORDERS_PER_PAGE]
+        next_cursor = encode_cursor(orders[-1].created_at, orders[-1].id)
+
+    filters = {
+        'status': status if status in ORDER_STATUSES else '',
+        'date_from': date_from.strftime('%Y-%m-%d') if date_from else '',
+        'date_to': date_to.strftime('%Y-%m-%d') if date_to else ''
+    }
+    return render_template('admin/orders.html', orders=orders, statuses=ORDER_STATUSES,
+                           filters=filters, next_cursor=next_cursor,
+                           is_first_page=cursor is None)
+
+@app.route('/admin/export/orders.<fmt>')
+@admin_required
+@replica_router.reads
+def export_orders(fmt):
+    """Stream order lines as CSV or NDJSON, optionally gzipped, honouring the order console filters"""
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    formatter, mimetype = EXPORT_FORMATS[fmt]
+    rows = order_export_rows(request.args.get('status'), parse_date_arg('date_from'), parse_date_arg('date_to'))
+    
+    chunks = formatter(rows)
+    filename = f'orders.{fmt}'
+    if request.args.get('gzip'):
+        chunks = gzip_chunks(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.cli.command('export-orders')
+@click.option('--format', 'fmt', type=click.Choice(sorted(EXPORT_FORMATS)), default='csv')
+@click.option('--status', type=click.Choice(ORDER_STATUSES))
+@click.option('--from', 'date_from', type=click.DateTime(['%Y-%m-%d']), help='First day, inclusive')
+@click.option('--to', 'date_to', type=click.DateTime(['%Y-%m-%d']), help='Last day, inclusive')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output')
+@click.option('--output', '-o', type=click.File('wb'), default='-')
+def export_orders_command(fmt, status, date_from, date_to, compress, output):
+    """Stream order lines to a file or stdout"""
+    chunks = EXPORT_FORMATS[fmt][0](order_export_rows(status, date_from, date_to))
+    if compress:
+        chunks = gzip_chunks(chunks)
+    else:
+        chunks = (chunk.encode('utf-8') for chunk in chunks)
+    for chunk in chunks:
+        output.write(chunk)
 
 @app.route('/admin/update_order_status/<int:order_id>', methods=['POST'])
 @admin_required
 def update_order_status(order_id):
     order = Order.query.get_or_404(order_id)
-    order.status = request.form['status']
+    status = request.form['status']
+    if status != order.status:
+        order.status = status
+        job_queue.enqueue('order_status', {'order_id': order.id, 'status': status},
+                          key=f'order-status:{order.id}:{status}')
     db.session.commit()
     flash('Order status updated!', 'success')
     return redirect(url_for('admin_orders'))
@@ -719,6 +1711,7 @@ def edit_user(user_id):
             user.password_hash = generate_password_hash(new_password)
         
         db.session.commit()
+        invalidate_principal(user_id)
         flash('User updated successfully!', 'success')
         return redirect(url_for('admin_users'))
     
@@ -735,15 +1728,341 @@ def delete_user(user_id):
     
     db.session.delete(user)
     db.session.commit()
+    invalidate_principal(user_id)
     flash('User deleted successfully!', 'success')
     return redirect(url_for('admin_users'))
 
+# ============================================
+# JSON API (v1)
+# ============================================
+def api_error(message, status=400, **extra):
+    return jsonify(error=message, **extra), status
+
+def api_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return api_error('Authentication required.', 401)
+        return f(*args, **kwargs)
+    return decorated_function
+
+def conditional_json(payload):
+    """JSON response carrying a content ETag; a matching If-None-Match gets an empty 304"""
+    response = jsonify(payload)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+def compact_product(product):
+    """Listing-sized fields of a serialize_product() dict"""
+    return {
+        'id': product['id'],
+        'name': product['name'],
+        'price': product['price'],
+        'stock': product['stock'],
+        'image': product['image'],
+        'category_id': product['category_id']
+    }
+
+def cart_payload(user_id):
+    quantities = cart_store.items(user_id)
+    rows = db.session.execute(
+        db.select(Product.id, Product.name, Product.price, Product.image).where(Product.id.in_(quantities.keys()))
+    ).all() if quantities else []
+    found = {r.id: r for r in rows}
+    items = [
+        {'product_id': product_id, 'name': found[product_id].name, 'price': found[product_id].price,
+         'image': found[product_id].image, 'quantity': quantity}
+        for product_id, quantity in quantities.items() if product_id in found
+    ]
+    return {'items': items, 'subtotal': sum(i['price'] * i['quantity'] for i in items)}
+
+def parse_cart_lines(payload):
+    """Turn [{'product_id', 'quantity'}, ...] into {product_id: quantity}, merging repeats; raises ValueError"""
+    if not isinstance(payload, list) or not payload:
+        raise ValueError('items must be a non-empty list.')
+    if len(payload) > API_BATCH_LIMIT:
+        raise ValueError(f'At most {API_BATCH_LIMIT} items per request.')
+    quantities = {}
+    for line in payload:
+        product_id, quantity = int(line['product_id']), int(line.get('quantity', 1))
+        if quantity < 1:
+            raise ValueError('quantity must be at least 1.')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+def cart_stock_errors(user_id, quantities, replace=False):
+    """Per-product problems with putting quantities in the cart, checked against stock in one query"""
+    stock = dict(db.session.execute(
+        db.select(Product.id, Product.stock).where(Product.id.in_(quantities.keys()), Product.is_active == True)
+    ).all())
+    in_cart = {} if replace else cart_store.items(user_id)
+    errors = []
+    for product_id, quantity in quantities.items():
+        if product_id not in stock:
+            errors.append({'product_id': product_id, 'reason': 'not_found', 'error': 'Product not found.'})
+        elif in_cart.get(product_id, 0) + quantity > stock[product_id]:
+            errors.append({'product_id': product_id, 'reason': 'out_of_stock',
+                           'error': f'Only {stock[product_id]} items available in stock.'})
+    return errors
+
+@app.route('/api/v1/session', methods=['POST'])
+def api_login():
+    data = request.get_json(silent=True) or {}
+    user = User.query.filter_by(username=data.get('username', '')).first()
+    if not user or not check_password_hash(user.password_hash, data.get('password', '')):
+        return api_error('Invalid username or password.', 401)
+    session['user_id'] = user.id
+    session['username'] = user.username
+    session['is_admin'] = user.is_admin
+    invalidate_principal(user.id)
+    return jsonify(id=user.id, username=user.username, is_admin=user.is_admin)
+
+@app.route('/api/v1/session', methods=['DELETE'])
+def api_logout():
+    session.clear()
+    return '', 204
+
+@app.route('/api/v1/categories')
+@replica_router.reads
+def api_categories():
+    return conditional_json({'categories': active_categories()})
+
+@app.route('/api/v1/products')
+@replica_router.reads
+def api_products():
+    """Product listing with the storefront filters, or ?ids=1,2,3 to fetch up to API_BATCH_LIMIT products at once"""
+    if 'ids' in request.args:
+        try:
+            ids = [int(i) for i in request.args['ids'].split(',') if i.strip()]
+        except ValueError:
+            return api_error('ids must be a comma-separated list of integers.')
+        if len(ids) > API_BATCH_LIMIT:
+            return api_error(f'At most {API_BATCH_LIMIT} ids per request.')
+        rows = db.session.execute(
+            db.select(Product.id, Product.name, Product.price, Product.stock, Product.image, Product.category_id)
+            .where(Product.id.in_(ids), Product.is_active == True)
+        ).all()
+        found = {row.id: dict(row._mapping) for row in rows}
+        return conditional_json({
+            'products': [found[i] for i in dict.fromkeys(ids) if i in found],
+            'missing': [i for i in dict.fromkeys(ids) if i not in found]
+        })
+    
+    listing = product_listing(request.args)
+    return conditional_json({
+        'products': [compact_product(p) for p in listing['products']],
+        'next_cursor': listing['next_cursor'],
+        'total': listing['total'],
+        'total_capped': listing['total_capped']
+    })
+
+@app.route('/api/v1/products/<int:product_id>')
+@replica_router.reads
+def api_product(product_id):
+    entry = product_detail_entry(product_id)
+    if entry is None:
+        return api_error('Product not found.', 404)
+    return conditional_json({
+        'product': entry['product'],
+        'related': [compact_product(p) for p in entry['related']]
+    })
+
+@app.route('/api/v1/cart')
+@api_login_required
+def api_cart():
+    return jsonify(cart_payload(session['user_id']))
+
+@app.route('/api/v1/cart/items', methods=['POST'])
+@api_login_required
+def api_add_cart_items():
+    """Add many products to the cart in one call: {"items": [{"product_id": 1, "quantity": 2}, ...]}"""
+    data = request.get_json(silent=True) or {}
+    try:
+        quantities = parse_cart_lines(data.get('items'))
+    except (KeyError, TypeError, ValueError) as e:
+        return api_error(str(e) if isinstance(e, ValueError) else 'Each item needs a product_id and quantity.')
+    
+    errors = cart_stock_errors(session['user_id'], quantities)
+    if errors:
+        return api_error('Some items could not be added.', 409, items=errors)
+    cart_store.add(session['user_id'], quantities)
+    db.session.commit()
+    return jsonify(cart_payload(session['user_id']))
+
+@app.route('/api/v1/cart/items/<int:product_id>', methods=['PUT'])
+@api_login_required
+def api_set_cart_item(product_id):
+    """Set one line's quantity: {"quantity": 3}; zero removes it"""
+    data = request.get_json(silent=True) or {}
+    try:
+        quantity = int(data['quantity'])
+    except (KeyError, TypeError, ValueError):
+        return api_error('quantity must be an integer.')
+    
+    if quantity <= 0:
+        return api_remove_cart_item(product_id)
+    errors = cart_stock_errors(session['user_id'], {product_id: quantity}, replace=True)
+    if errors:
+        return api_error(errors[0]['error'], 404 if errors[0]['reason'] == 'not_found' else 409, items=errors)
+    cart_store.set(session['user_id'], product_id, quantity)
+    db.session.commit()
+    return jsonify(cart_payload(session['user_id']))
+
+@app.route('/api/v1/cart/items/<int:product_id>', methods=['DELETE'])
+@api_login_required
+def api_remove_cart_item(product_id):
+    cart_store.remove(session['user_id'], product_id)
+    db.session.commit()
+    return jsonify(cart_payload(session['user_id']))
+
+@app.route('/api/v1/orders')
+@api_login_required
+@replica_router.reads
+def api_orders():
+    """The user's orders, newest first, keyset-paginated with ?cursor="""
+    stmt = (
+        db.select(Order.id, Order.created_at, Order.status, Order.total_amount, Order.item_count)
+        .where(Order.user_id == session['user_id'])
+    )
+    cursor = decode_cursor(request.args.get('cursor'))
+    if cursor:
+        cursor_created_at, cursor_id = cursor
+        stmt = stmt.where(db.or_(
+            Order.created_at < cursor_created_at,
+            db.and_(Order.created_at == cursor_created_at, Order.id < cursor_id)
+        ))
+    rows = db.session.execute(
+        stmt.order_by(Order.created_at.desc(), Order.id.desc()).limit(API_ORDERS_PER_PAGE + 1)
+    ).all()
+    
+    next_cursor = None
+    if len(rows) > API_ORDERS_PER_PAGE:
+        rows = rows[:API_ORDERS_PER_PAGE]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return jsonify(orders=[
+        {'id': r.id, 'created_at': r.created_at.isoformat(), 'status': r.status,
+         'total_amount': r.total_amount, 'item_count': r.item_count}
+        for r in rows
+    ], next_cursor=next_cursor)
+
+@app.route('/api/v1/orders/<int:order_id>')
+@api_login_required
+@replica_router.reads
+def api_order(order_id):
+    order = Order.query.filter_by(id=order_id, user_id=session['user_id']).first()
+    if not order:
+        return api_error('Order not found.', 404)
+    items = db.session.execute(
+        db.select(OrderItem.product_id, Product.name, OrderItem.quantity, OrderItem.price)
+        .outerjoin(Product, Product.id == OrderItem.product_id)
+        .where(OrderItem.order_id == order.id)
+        .order_by(OrderItem.id)
+    ).all()
+    return jsonify(
+        id=order.id,
+        created_at=order.created_at.isoformat(),
+        status=order.status,
+        total_amount=order.total_amount,
+        shipping_address=order.shipping_address,
+        payment_method=order.payment_method,
+        items=[dict(item._mapping) for item in items]
+    )
+
+# ============================================
+# METRICS
+# ============================================
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint: per-endpoint query counts and DB time, pool and cache gauges"""
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            abort(403)
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        abort(403)
+    # Pool, cache and routing numbers belong to the worker answering the scrape, so they carry its pid
+    worker = {'worker': str(os.getpid())}
+    gauges = {f'db_pool_{name}': (f'Connection pool {name.replace("_", " ")}', value)
+              for name, value in pool_metrics.snapshot().items()}
+    gauges.update({f'catalog_cache_{name}': (f'Catalog cache {name.replace("_", " ")}', value)
+                   for name, value in catalog_cache.stats().items()})
+    gauges.update({f'db_{name}': (f'Read routing {name.replace("_", " ")}', value)
+                   for name, value in replica_router.stats().items()})
+    jobs = job_queue.stats()
+    job_gauges = {f'jobs_{status}': (f'Background jobs {status}', jobs.get(status, 0))
+                  for status in ('queued', 'running', 'done', 'failed')}
+    # Request counters cover every worker with METRICS_DIR; without it only this worker, labelled as such
+    body = (render_prometheus(profiler.collect(), labels=None if profiler.snapshot_dir else worker)
+            + render_prometheus(gauges=gauges, labels=worker)
+            + render_prometheus(gauges=job_gauges))
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+# ============================================
+# STATIC ASSETS
+# ============================================
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Write fingerprinted, precompressed copies of the CSS/JS under static/dist"""
+    manifest = build_static_assets(app.static_folder)
+    for source, hashed in sorted(manifest.items()):
+        print(f"{source} -> {hashed}")
+    asset_manifest.load()
+
+# ============================================
+# SCHEMA COMMANDS
+# ============================================
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Create missing tables and apply pending schema migrations"""
+    db.create_all()
+    applied = migrations.upgrade(db.engine)
+    print(f"Applied {len(applied)} migration(s)" if applied else "Schema is up to date")
+    filled = fill_order_summaries()
+    if filled:
+        print(f"Filled summaries for {filled} order(s)")
+
+@app.cli.command('db-status')
+def db_status_command():
+    """List schema migrations that have not been applied yet"""
+    pending = migrations.pending(db.engine)
+    for version, name, _ in pending:
+        print(f"pending {version}: {name}")
+    if not pending:
+        print("Schema is up to date")
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if a storefront or admin route's query falls back to a full table scan"""
+    admin = User.query.filter_by(is_admin=True).first()
+    product = Product.query.filter_by(is_active=True).first()
+    if not admin or not product:
+        raise click.ClickException('Needs at least one admin user and one active product to probe routes.')
+    urls = [
+        '/', '/products', f'/products?category={product.category_id}', '/products?search=a',
+        '/products?sort=price_asc', '/products?sort=name&in_stock=1',
+        f'/product/{product.id}', '/cart', '/my_orders',
+        '/admin', '/admin/orders', '/admin/orders?status=Pending'
+    ]
+    db.session.remove()
+    catalog_cache.invalidate()
+    principal_cache.clear()
+    
+    offenders = query_plans.check(app, db.engine, urls, {'user_id': admin.id})
+    for url, table, statement in offenders:
+        print(f"{url}: full scan of {table}\n    {' '.join(statement.split())}")
+    if offenders:
+        raise SystemExit(1)
+    print(f"OK: no full table scans across {len(urls)} routes")
+
 # ============================================
 # RUN APP
 # ============================================
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        migrations.upgrade(db.engine)
+        fill_order_summaries()
         
         admin = User.query.filter_by(username='admin').first()
         if not admin:
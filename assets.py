@@ -0,0 +1,164 @@
+"""
+Fingerprinted static assets and an in-process static file server
+
+build() copies each CSS/JS file under static/ to static/dist/ with a short
+content hash in its name (css/style.css -> dist/css/style.3f2a91c0.css),
+writes gzip and, when a brotli module is installed, brotli copies next to
+it, and records the mapping in dist/manifest.json. AssetManifest rewrites
+url_for('static', filename=...) through that manifest, so templates need
+no changes. StaticFiles is WSGI middleware that answers /static requests
+before Flask's request handling runs: hashed files (dist/ and content-hashed
+uploads) get a one-year immutable Cache-Control, everything else is
+revalidated by ETag, and precompressed copies are sent when the client
+accepts them. Files go out through the server's wsgi.file_wrapper, which
+gunicorn serves with sendfile().
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+from werkzeug.security import safe_join
+from werkzeug.wrappers import Request, Response
+from werkzeug.wsgi import wrap_file
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+ASSET_EXTENSIONS = {'.css', '.js'}
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+# dist/ output, and uploads named by their content hash (see images.py)
+IMMUTABLE_RE = re.compile(r'^(?:dist/.*\.[0-9a-f]{8}\.\w+|uploads/.*/[0-9a-f]{32}(?:-\d+)?\.\w+)$')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
+def compress(path):
+    """Write .gz (and .br if available) siblings of a file; returns the encodings written"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = ['gzip']
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, 9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data))
+        written.append('br')
+    return written
+
+
+def build(static_folder):
+    """Rebuild static/dist from the CSS/JS sources; returns the new manifest"""
+    dist = os.path.join(static_folder, DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder)
+        if rel_root.split(os.sep)[0] in (DIST, 'uploads'):
+            dirs[:] = []
+            continue
+        for name in sorted(files):
+            stem, ext = os.path.splitext(name)
+            if ext not in ASSET_EXTENSIONS:
+                continue
+            source = os.path.join(root, name)
+            with open(source, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:8]
+            logical = os.path.normpath(os.path.join(rel_root, name)).replace(os.sep, '/')
+            hashed = posixpath.join(DIST, posixpath.dirname(logical), f'{stem}.{digest}{ext}')
+            target = os.path.join(static_folder, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            compress(target)
+            manifest[logical] = hashed
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class AssetManifest:
+    """Maps logical static filenames to their fingerprinted copies for url_for('static', ...)"""
+
+    def __init__(self, static_folder):
+        self.path = os.path.join(static_folder, DIST, MANIFEST)
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+        return self.entries
+
+    def init_app(self, app):
+        @app.url_defaults
+        def fingerprint_static(endpoint, values):
+            # The debug server serves sources as edited; a deployed app serves the last build
+            if endpoint == 'static' and not app.debug:
+                filename = values.get('filename')
+                if filename in self.entries:
+                    values['filename'] = self.entries[filename]
+
+
+class StaticFiles:
+    """WSGI middleware serving files under url_prefix straight from static_folder"""
+
+    def __init__(self, wsgi_app, static_folder, url_prefix='/static'):
+        self.wsgi_app = wsgi_app
+        self.static_folder = os.path.abspath(static_folder)
+        self.url_prefix = url_prefix.rstrip('/') + '/'
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.url_prefix) or environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return self.wsgi_app(environ, start_response)
+        filename = path[len(self.url_prefix):]
+        full_path = safe_join(self.static_folder, filename)
+        if full_path is None or not os.path.isfile(full_path):
+            # Let Flask produce its usual 404
+            return self.wsgi_app(environ, start_response)
+        return self.serve(environ, filename, full_path)(environ, start_response)
+
+    def serve(self, environ, filename, full_path):
+        request = Request(environ)
+        immutable = IMMUTABLE_RE.match(filename) is not None
+        ext = os.path.splitext(filename)[1]
+        send_path, encoding = full_path, None
+        if ext in COMPRESSIBLE_EXTENSIONS:
+            for name, suffix in ENCODINGS:
+                if name in request.accept_encodings and os.path.isfile(full_path + suffix):
+                    send_path, encoding = full_path + suffix, name
+                    break
+        stat = os.stat(send_path)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = Response(mimetype=mimetype)
+        response.content_length = stat.st_size
+        response.last_modified = int(stat.st_mtime)
+        response.set_etag(f'{int(stat.st_mtime)}-{stat.st_size}-{encoding or "identity"}')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+        if ext in COMPRESSIBLE_EXTENSIONS:
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            response.content_encoding = encoding
+        response.make_conditional(request)
+        # Only open the file when a body will actually be sent (not for 304s or HEAD)
+        if response.status_code == 200 and request.method == 'GET':
+            response.response = wrap_file(environ, open(send_path, 'rb'))
+            response.direct_passthrough = True
+        return response
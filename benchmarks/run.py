@@ -0,0 +1,284 @@
+"""
+Storefront and checkout load benchmark
+
+Drives the main customer and admin routes either in-process through the
+Flask test client (which also counts SQL statements per request) or over
+HTTP against a real gunicorn server, and reports throughput, latency
+percentiles, queries per request and peak RSS:
+
+    python benchmarks/run.py --seed --products 100000 --orders 200000 --json report.json
+    python benchmarks/run.py --mode gunicorn --workers 4 --concurrency 16 --baseline report.json
+
+Without DATABASE_URL a throwaway SQLite database is seeded first. With
+--baseline, any scenario whose p95 latency or throughput is worse than the
+baseline by more than --tolerance percent makes the run exit non-zero.
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from seed import PASSWORD, WORDS, seed  # noqa: E402
+
+# name -> (method, needs admin, builds (path, form data) from the random source and id ranges)
+SCENARIOS = {
+    'index': ('GET', False, lambda rng, ids: ('/', None)),
+    'products_search': ('GET', False, lambda rng, ids: (f'/products?search={rng.choice(WORDS)[:4]}', None)),
+    'product_detail': ('GET', False, lambda rng, ids: (f'/product/{rng.choice(ids["products"])}', None)),
+    'add_to_cart': ('POST', False, lambda rng, ids: (f'/add_to_cart/{rng.choice(ids["products"])}', {'quantity': '1'})),
+    'checkout': ('POST', False, lambda rng, ids: ('/checkout', {'shipping_address': 'Bench Street', 'payment_method': 'COD'})),
+    'my_orders': ('GET', False, lambda rng, ids: ('/my_orders', None)),
+    'admin_orders': ('GET', True, lambda rng, ids: ('/admin/orders', None)),
+}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(timings, elapsed, queries, errors):
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'throughput_rps': len(timings) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'mean_ms': statistics.mean(timings) * 1000 if timings else 0.0,
+        'queries_per_request': statistics.mean(queries) if queries else None,
+    }
+
+
+def load_ids(app, db):
+    from app import Product, User
+    with app.app_context():
+        products = [p for (p,) in db.session.query(Product.id).filter_by(is_active=True).limit(100000)]
+        customers = User.query.filter(User.username.like('bench_user_%')).order_by(User.id).limit(256).all()
+        admin = User.query.filter_by(username='bench_admin').first()
+        return {'products': products, 'customers': [(c.id, c.username) for c in customers],
+                'admin': admin.username, 'admin_id': admin.id}
+
+
+def run_client(scenarios, requests, ids):
+    """Serve every request in-process and count SQL statements with a cursor listener"""
+    from sqlalchemy import event
+    from app import app, db
+
+    with app.app_context():
+        engine = db.engine
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(1))
+
+    clients = {}
+    for admin in (False, True):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = ids['admin_id'] if admin else ids['customers'][0][0]
+        clients[admin] = client
+
+    rng = random.Random(1)
+    results = {}
+    for name in scenarios:
+        method, admin, build = SCENARIOS[name]
+        client = clients[admin]
+        timings, queries, errors = [], [], 0
+        start = time.perf_counter()
+        for _ in range(requests):
+            if name == 'checkout':
+                client.post(f'/add_to_cart/{rng.choice(ids["products"])}', data={'quantity': '1'})
+            path, data = build(rng, ids)
+            statements.clear()
+            t0 = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            timings.append(time.perf_counter() - t0)
+            queries.append(len(statements))
+            errors += response.status_code >= 400
+        # Exclude untimed checkout setup from throughput
+        elapsed = sum(timings) if name == 'checkout' else time.perf_counter() - start
+        results[name] = summarize(timings, elapsed, queries, errors)
+    return results, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def tree_peak_rss_mb(pid):
+    """Sum VmHWM of a process and its children (Linux only)"""
+    total = 0
+    pids = [str(pid)]
+    try:
+        pids += open(f'/proc/{pid}/task/{pid}/children').read().split()
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            for line in open(f'/proc/{p}/status'):
+                if line.startswith('VmHWM:'):
+                    total += int(line.split()[1])
+        except OSError:
+            pass
+    return total / 1024
+
+
+def http_opener(base, username):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    form = urllib.parse.urlencode({'username': username, 'password': PASSWORD}).encode()
+    opener.open(base + '/login', data=form)
+    return opener
+
+
+def run_gunicorn(scenarios, requests, ids, workers, concurrency):
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app'],
+        cwd=ROOT, env=os.environ.copy()
+    )
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(base + '/', timeout=1)
+                break
+            except OSError:
+                time.sleep(0.2)
+        else:
+            raise RuntimeError('gunicorn did not start')
+
+        results = {}
+        for name in scenarios:
+            method, admin, build = SCENARIOS[name]
+            timings, errors, lock = [], [0], threading.Lock()
+            per_thread = max(1, requests // concurrency)
+
+            def worker(seed_value):
+                rng = random.Random(seed_value)
+                # Each thread shops as its own customer so carts do not collide across threads
+                customer = ids['customers'][seed_value % len(ids['customers'])][1]
+                opener = http_opener(base, ids['admin'] if admin else customer)
+                for _ in range(per_thread):
+                    if name == 'checkout':
+                        opener.open(base + f'/add_to_cart/{rng.choice(ids["products"])}', data=b'quantity=1')
+                    path, data = build(rng, ids)
+                    body = urllib.parse.urlencode(data).encode() if data is not None else None
+                    t0 = time.perf_counter()
+                    try:
+                        opener.open(base + path, data=body if method == 'POST' else None, timeout=60).read()
+                        failed = False
+                    except OSError:
+                        failed = True
+                    elapsed = time.perf_counter() - t0
+                    with lock:
+                        timings.append(elapsed)
+                        errors[0] += failed
+
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            results[name] = summarize(timings, time.perf_counter() - start, [], errors[0])
+        return results, tree_peak_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions against a previous report"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance / 100):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms")
+        if previous['throughput_rps'] and current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance / 100):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']:.0f} -> {current['throughput_rps']:.0f} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=['client', 'gunicorn'], default='client')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads in gunicorn mode')
+    parser.add_argument('--seed', action='store_true', help='seed synthetic data first (implied without DATABASE_URL)')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--json', dest='json_path', help='write the report here')
+    parser.add_argument('--baseline', help='previous JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=10.0, help='allowed regression in percent')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+        args.seed = True
+    if args.seed:
+        seed(args.products, args.users, args.orders)
+
+    from app import app, db
+    ids = load_ids(app, db)
+    with app.app_context():
+        backend = db.engine.url.get_backend_name()
+    if args.mode == 'client':
+        results, peak_rss_mb = run_client(args.scenarios, args.requests, ids)
+    else:
+        results, peak_rss_mb = run_gunicorn(args.scenarios, args.requests, ids, args.workers, args.concurrency)
+
+    report = {
+        'mode': args.mode,
+        'database': backend,
+        'scale': {'products': args.products, 'users': args.users, 'orders': args.orders} if args.seed else None,
+        'peak_rss_mb': peak_rss_mb,
+        'results': results,
+    }
+
+    print(f"{'scenario':<16} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}")
+    for name, r in results.items():
+        queries = f"{r['queries_per_request']:.1f}" if r['queries_per_request'] is not None else '-'
+        print(f"{name:<16} {r['throughput_rps']:>8.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {queries:>8} {r['errors']:>7}")
+    print(f"peak RSS: {peak_rss_mb:.0f} MB")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
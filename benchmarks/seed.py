@@ -0,0 +1,141 @@
+"""
+Synthetic data seeder for benchmarks
+
+Fills a database with categories, products, users, carts and order history
+at a chosen scale, using batched executemany inserts so that millions of
+rows load in minutes:
+
+    python benchmarks/seed.py --products 100000 --users 10000 --orders 200000
+
+Seeds a fresh SQLite file under /tmp unless DATABASE_URL is set. Every
+seeded user has the password 'bench'; user 'bench_admin' is an admin.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = [
+    'apple', 'banana', 'orange', 'mango', 'tomato', 'potato', 'onion', 'carrot', 'milk', 'cheese',
+    'yogurt', 'bread', 'butter', 'rice', 'flour', 'sugar', 'coffee', 'tea', 'juice', 'chips',
+    'cookies', 'honey', 'jam', 'pasta', 'lentils', 'spinach', 'garlic', 'ginger', 'paneer', 'eggs'
+]
+BATCH_SIZE = 10000
+PASSWORD = 'bench'
+
+
+def batched_insert(db, table, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            db.session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+    db.session.commit()
+
+
+def max_id(db, model):
+    return db.session.query(db.func.max(model.id)).scalar() or 0
+
+
+def ids_after(db, model, last_id):
+    """Ids of the rows inserted since max_id() returned last_id, in insertion order"""
+    return [row_id for row_id, in db.session.query(model.id).filter(model.id > last_id).order_by(model.id)]
+
+
+def seed(products, users, orders, categories=40, items_per_order=3, seed_value=42):
+    from werkzeug.security import generate_password_hash
+    from app import (app, db, User, Category, Product, Order, OrderItem, Cart,
+                     search_index, rebuild_store_stats, fill_order_summaries, co_purchase_index, sales_rollup,
+                     migrations)
+
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    password_hash = generate_password_hash(PASSWORD)
+    statuses = ['Pending', 'Processing', 'Shipped', 'Delivered', 'Cancelled']
+
+    with app.app_context():
+        db.create_all()
+        migrations.upgrade(db.engine, log=lambda message: None)
+
+        batched_insert(db, Category.__table__, (
+            {'name': f'{WORDS[i % len(WORDS)].title()} {i}', 'description': 'Benchmark category',
+             'is_active': True, 'created_at': now}
+            for i in range(categories)
+        ))
+        category_ids = [c.id for c in Category.query.all()]
+
+        last_product = max_id(db, Product)
+        batched_insert(db, Product.__table__, (
+            {'sku': f'BENCH-{i}', 'name': f'{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}',
+             'description': f'{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(WORDS)}',
+             'price': round(rng.uniform(5, 500), 2), 'stock': rng.randint(0, 10 ** 6),
+             'category_id': rng.choice(category_ids), 'is_active': rng.random() > 0.05,
+             'created_at': now - timedelta(days=rng.randint(0, 730))}
+            for i in range(products)
+        ))
+        product_ids = ids_after(db, Product, last_product)
+
+        last_user = max_id(db, User)
+        batched_insert(db, User.__table__, (
+            {'username': 'bench_admin' if i == 0 else f'bench_user_{i}', 'email': f'bench{i}@example.com',
+             'password_hash': password_hash, 'full_name': f'Bench User {i}', 'address': f'{i} Bench Street',
+             'is_admin': i == 0, 'created_at': now}
+            for i in range(users)
+        ))
+        user_ids = ids_after(db, User, last_user)
+
+        last_order = max_id(db, Order)
+        batched_insert(db, Order.__table__, (
+            {'user_id': rng.choice(user_ids), 'total_amount': round(rng.uniform(50, 5000), 2),
+             'shipping_address': 'Bench Street', 'payment_method': 'COD', 'status': rng.choice(statuses),
+             'created_at': now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))}
+            for _ in range(orders)
+        ))
+        order_ids = ids_after(db, Order, last_order)
+        batched_insert(db, OrderItem.__table__, (
+            {'order_id': order_id, 'product_id': rng.choice(product_ids),
+             'quantity': rng.randint(1, 5), 'price': round(rng.uniform(5, 500), 2)}
+            for order_id in order_ids for _ in range(rng.randint(1, 2 * items_per_order - 1))
+        ))
+        batched_insert(db, Cart.__table__, (
+            {'user_id': user_id, 'product_id': product_id, 'quantity': 1, 'created_at': now}
+            for user_id in user_ids[1:min(users, 1000)]
+            for product_id in rng.sample(product_ids, min(3, products))
+        ))
+
+        search_index().rebuild()
+        rebuild_store_stats()
+        fill_order_summaries()
+        co_purchase_index.update(full=True)
+        sales_rollup.update(full=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--categories', type=int, default=40)
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    start = time.perf_counter()
+    seed(args.products, args.users, args.orders, args.categories)
+    print(f"Seeded {args.products} products, {args.users} users, {args.orders} orders "
+          f"in {time.perf_counter() - start:.1f}s into {os.environ['DATABASE_URL']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Hot-SKU stock contention benchmark
+
+Spawns several worker processes that all try to buy the same product one
+unit at a time through reserve_stock(), then checks that exactly the
+initial stock was sold and nothing was oversold.
+
+    python benchmarks/stock_contention.py --workers 8 --attempts 200 --stock 500
+
+Runs against a throwaway SQLite file unless DATABASE_URL is set.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def worker(product_id, attempts):
+    from app import app, db, reserve_stock
+    sold = 0
+    with app.app_context():
+        for _ in range(attempts):
+            try:
+                if reserve_stock({product_id: 1}):
+                    db.session.commit()
+                    sold += 1
+                else:
+                    db.session.rollback()
+            except Exception:
+                # Lock timeouts count as a lost sale, never an oversell
+                db.session.rollback()
+    return sold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--attempts', type=int, default=200, help='purchases attempted per worker')
+    parser.add_argument('--stock', type=int, default=500)
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    from app import app, db, Category, Product
+    with app.app_context():
+        db.create_all()
+        category = Category(name='Benchmark')
+        db.session.add(category)
+        db.session.flush()
+        product = Product(name='Hot SKU', price=1, stock=args.stock, category_id=category.id)
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+
+    ctx = multiprocessing.get_context('spawn')
+    start = time.perf_counter()
+    with ctx.Pool(args.workers) as pool:
+        sold = sum(pool.starmap(worker, [(product_id, args.attempts)] * args.workers))
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        remaining = db.session.get(Product, product_id).stock
+
+    print(f"workers={args.workers} attempts={args.workers * args.attempts} "
+          f"sold={sold} remaining={remaining} elapsed={elapsed:.2f}s "
+          f"({args.workers * args.attempts / elapsed:.0f} attempts/s)")
+
+    assert remaining >= 0, f"stock went negative: {remaining}"
+    assert sold + remaining == args.stock, f"oversold: sold {sold} of {args.stock}, {remaining} left"
+    print("OK: zero oversell")
+
+
+if __name__ == '__main__':
+    main()
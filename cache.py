@@ -0,0 +1,215 @@
+"""
+Two-tier read-through cache for catalog data
+
+Entries live in a bounded in-process LRU and, when configured, in a shared
+store (Redis, or an in-memory stand-in for tests and single-node setups).
+Keys are prefixed with a catalog version number; bumping the version makes
+every older entry unreachable at once, and they age out through the TTL.
+
+The version lives where every worker can see a bump: in the shared store
+when there is one (re-read at most every version_ttl seconds), otherwise in
+the modification time of a version file, so gunicorn workers on one host
+drop stale entries as soon as any of them invalidates.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+
+MISSING = object()
+
+
+class LRUStore:
+    """Thread-safe in-process LRU with a per-entry TTL"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class MemorySharedStore:
+    """Local stand-in for the shared tier with the same string get/set/incr semantics as Redis"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.time() + ttl if ttl else None, value)
+
+    def incr(self, key):
+        with self._lock:
+            expires_at, value = self._data.get(key, (None, '0'))
+            value = str(int(value) + 1)
+            self._data[key] = (expires_at, value)
+            return int(value)
+
+
+class RedisSharedStore:
+    """Shared tier backed by any Redis-protocol server"""
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, ex=ttl)
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+
+def create_shared_store(url):
+    """Build the shared tier from a URL: '' disables it, 'memory://' uses the local stand-in"""
+    if not url:
+        return None
+    if url.startswith('memory://'):
+        return MemorySharedStore()
+    return RedisSharedStore(url)
+
+
+class CatalogCache:
+    """Read-through cache whose entries are scoped to the current catalog version"""
+
+    version_key = 'catalog:version'
+
+    def __init__(self, local=None, shared=None, ttl=60, load_context=None, version_file=None, version_ttl=1.0):
+        self.local = local if local is not None else LRUStore()
+        self.shared = shared
+        self.ttl = ttl
+        # Context manager factory wrapped around every loader call, e.g. to pin reads to the primary
+        self.load_context = load_context or nullcontext
+        # Without a shared store, a file whose mtime carries the version across processes; None = this process only
+        self.version_file = version_file
+        self.version_ttl = version_ttl
+        self._version = 0
+        self._version_expires = 0.0
+        self._lock = threading.Lock()
+        self.counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def version(self):
+        if self.shared is not None:
+            now = time.monotonic()
+            if now >= self._version_expires:
+                self._version = int(self.shared.get(self.version_key) or 0)
+                self._version_expires = now + self.version_ttl
+            return self._version
+        if self.version_file is not None:
+            return self._file_version()
+        return self._version
+
+    def _file_version(self):
+        try:
+            return os.stat(self.version_file).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _bump_file_version(self):
+        current = self._file_version()
+        os.makedirs(os.path.dirname(self.version_file) or '.', exist_ok=True)
+        with open(self.version_file, 'a'):
+            pass
+        # Strictly newer than before, even twice in one clock tick or on filesystems with coarse timestamps
+        for step in (1, 10 ** 9):
+            stamp = max(time.time_ns(), current + step)
+            os.utime(self.version_file, ns=(stamp, stamp))
+            if self._file_version() > current:
+                return
+
+    def get_or_set(self, name, loader, ttl=None):
+        """Return the cached value for name, calling loader() and storing its JSON-safe result on a miss"""
+        ttl = ttl or self.ttl
+        key = f'catalog:v{self.version()}:{name}'
+
+        value = self.local.get(key)
+        if value is not MISSING:
+            self._count('local_hits')
+            return value
+
+        if self.shared is not None:
+            raw = self.shared.get(key)
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value, ttl)
+                self._count('shared_hits')
+                return value
+
+        self._count('misses')
+        with self.load_context():
+            value = loader()
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(key, json.dumps(value), ttl)
+        return value
+
+    def invalidate(self):
+        """Bump the catalog version so every cached entry is bypassed from now on"""
+        if self.shared is not None:
+            version = self.shared.incr(self.version_key)
+            with self._lock:
+                self._version = int(version)
+                self._version_expires = time.monotonic() + self.version_ttl
+        elif self.version_file is not None:
+            self._bump_file_version()
+        else:
+            with self._lock:
+                self._version += 1
+        self.local.clear()
+        self._count('invalidations')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['local_hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,366 @@
+"""
+Cart storage backends
+
+DatabaseCartStore reads and writes the cart table directly. WriteBehindCartStore
+keeps each cart as a {product_id: quantity} map in a fast key-value backend
+(in-process memory, or any Redis-protocol server so every worker sees the same
+carts) and writes changed carts back to the cart table from a background
+thread every few seconds, on checkout and at interpreter exit. One entry per
+(user_id, product_id) in both places preserves the table's unique constraint.
+
+Checkout and the flushers of every worker take a per-user lock in the backend
+around reading a cart and writing it back. Checkout takes the cart out of the
+backend (lines and dirty flag together) before writing it to the table, so a
+flusher that gets the lock afterwards finds nothing to restore once the
+order has emptied the table.
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+class DatabaseCartStore:
+    """Cart lines straight from the cart table, inside the caller's session; the caller commits"""
+
+    def __init__(self, db, cart_model):
+        self.db = db
+        self.Cart = cart_model
+
+    def items(self, user_id):
+        rows = self.db.session.execute(
+            select(self.Cart.product_id, self.Cart.quantity)
+            .where(self.Cart.user_id == user_id)
+            .order_by(self.Cart.id)
+        )
+        return dict(rows.all())
+
+    def _upsert(self, user_id, quantities, replace):
+        if quantities:
+            dialect = self.db.session.get_bind().dialect.name
+            self.db.session.execute(upsert_statement(dialect, self.Cart.__table__, user_id, quantities, replace))
+
+    def add(self, user_id, quantities):
+        self._upsert(user_id, quantities, replace=False)
+
+    def set(self, user_id, product_id, quantity):
+        if quantity <= 0:
+            self.remove(user_id, product_id)
+        else:
+            self._upsert(user_id, {product_id: quantity}, replace=True)
+
+    def remove(self, user_id, product_id):
+        self.db.session.execute(
+            delete(self.Cart).where(self.Cart.user_id == user_id, self.Cart.product_id == product_id)
+            .execution_options(synchronize_session=False)
+        )
+
+    def flush(self, user_id):
+        pass
+
+    def checkout(self, user_id):
+        pass
+
+
+def upsert_statement(dialect, table, user_id, quantities, replace):
+    """INSERT ... ON CONFLICT (user_id, product_id) adding to, or replacing, each line's quantity"""
+    now = datetime.utcnow()
+    stmt = (postgresql if dialect == 'postgresql' else sqlite).insert(table).values([
+        {'user_id': user_id, 'product_id': product_id, 'quantity': quantity, 'created_at': now}
+        for product_id, quantity in quantities.items()
+    ])
+    quantity = stmt.excluded.quantity if replace else table.c.quantity + stmt.excluded.quantity
+    return stmt.on_conflict_do_update(index_elements=['user_id', 'product_id'], set_={'quantity': quantity})
+
+
+class MemoryCartBackend:
+    """Carts in this process only; for single-process deployments and local development"""
+
+    def __init__(self, lock_stripes=64):
+        self._carts = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._user_locks = [threading.Lock() for _ in range(lock_stripes)]
+
+    def get(self, user_id):
+        with self._lock:
+            cart = self._carts.get(user_id)
+            return dict(cart) if cart is not None else None
+
+    def fill(self, user_id, items):
+        with self._lock:
+            self._carts.setdefault(user_id, OrderedDict(items))
+
+    def incr(self, user_id, product_id, delta):
+        with self._lock:
+            cart = self._carts.setdefault(user_id, OrderedDict())
+            cart[product_id] = cart.get(product_id, 0) + delta
+            self._dirty.add(user_id)
+
+    def put(self, user_id, product_id, quantity):
+        with self._lock:
+            self._carts.setdefault(user_id, OrderedDict())[product_id] = quantity
+            self._dirty.add(user_id)
+
+    def delete(self, user_id, product_id):
+        with self._lock:
+            self._carts.setdefault(user_id, OrderedDict()).pop(product_id, None)
+            self._dirty.add(user_id)
+
+    def take(self, user_id):
+        """Remove the cart and its dirty flag at once, returning the lines (None if not loaded)"""
+        with self._lock:
+            self._dirty.discard(user_id)
+            cart = self._carts.pop(user_id, None)
+            return dict(cart) if cart is not None else None
+
+    def lock(self, user_id):
+        return self._user_locks[hash(user_id) % len(self._user_locks)]
+
+    def pop_dirty(self, limit):
+        with self._lock:
+            return [self._dirty.pop() for _ in range(min(limit, len(self._dirty)))]
+
+    def mark_dirty(self, user_ids):
+        with self._lock:
+            self._dirty.update(user_ids)
+
+
+class RedisCartBackend:
+    """Carts as Redis hashes shared by every worker; a marker field records that a cart was loaded"""
+
+    LOADED = '_'
+
+    def __init__(self, url, prefix='cart:', ttl=7 * 24 * 3600, lock_timeout=30, lock_wait=10):
+        import redis
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.dirty_key = f'{prefix}dirty'
+        self.ttl = ttl
+        # A lock left by a killed worker expires after lock_timeout seconds
+        self.lock_timeout = lock_timeout
+        self.lock_wait = lock_wait
+
+    def _key(self, user_id):
+        return f'{self.prefix}{user_id}'
+
+    def get(self, user_id):
+        raw = self.client.hgetall(self._key(user_id))
+        if not raw:
+            return None
+        return {int(k): int(v) for k, v in raw.items() if k != self.LOADED}
+
+    def fill(self, user_id, items):
+        key = self._key(user_id)
+        pipe = self.client.pipeline()
+        # HSETNX so a line written by another worker since our read is not overwritten
+        pipe.hsetnx(key, self.LOADED, 1)
+        for product_id, quantity in items.items():
+            pipe.hsetnx(key, product_id, quantity)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def _write(self, user_id, command, *args):
+        key = self._key(user_id)
+        pipe = self.client.pipeline()
+        getattr(pipe, command)(key, *args)
+        pipe.hset(key, self.LOADED, 1)
+        pipe.expire(key, self.ttl)
+        pipe.sadd(self.dirty_key, user_id)
+        pipe.execute()
+
+    def incr(self, user_id, product_id, delta):
+        self._write(user_id, 'hincrby', product_id, delta)
+
+    def put(self, user_id, product_id, quantity):
+        self._write(user_id, 'hset', product_id, quantity)
+
+    def delete(self, user_id, product_id):
+        self._write(user_id, 'hdel', product_id)
+
+    def take(self, user_id):
+        """Remove the cart and its dirty flag in one MULTI, returning the lines (None if not loaded)"""
+        key = self._key(user_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hgetall(key)
+        pipe.delete(key)
+        pipe.srem(self.dirty_key, user_id)
+        raw = pipe.execute()[0]
+        if not raw:
+            return None
+        return {int(k): int(v) for k, v in raw.items() if k != self.LOADED}
+
+    def lock(self, user_id):
+        return self.client.lock(f'{self.prefix}lock:{user_id}', timeout=self.lock_timeout,
+                                blocking_timeout=self.lock_wait)
+
+    def pop_dirty(self, limit):
+        return [int(u) for u in self.client.spop(self.dirty_key, limit) or []]
+
+    def mark_dirty(self, user_ids):
+        if user_ids:
+            self.client.sadd(self.dirty_key, *user_ids)
+
+
+class WriteBehindCartStore:
+    """Serve carts from a key-value backend and persist changed carts to the cart table in the background"""
+
+    def __init__(self, backend, engine, cart_model, product_model, flush_interval=5, batch_size=500):
+        self.backend = backend
+        self.engine = engine
+        self.table = cart_model.__table__
+        self.product_table = product_model.__table__
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_flusher(self):
+        # Started lazily and per process, so gunicorn workers forked from a preloaded app each get one
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='cart-flusher', daemon=True).start()
+            atexit.register(self.flush_dirty)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush_dirty()
+            except Exception:
+                # flush_dirty() re-marked the carts it could not write; the next round retries them
+                pass
+
+    def items(self, user_id):
+        cart = self.backend.get(user_id)
+        if cart is None:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(self.table.c.product_id, self.table.c.quantity)
+                    .where(self.table.c.user_id == user_id)
+                    .order_by(self.table.c.id)
+                )
+                cart = dict(rows.all())
+            self.backend.fill(user_id, cart)
+            cart = self.backend.get(user_id) or {}
+        return cart
+
+    def add(self, user_id, quantities):
+        self.items(user_id)
+        for product_id, quantity in quantities.items():
+            self.backend.incr(user_id, product_id, quantity)
+        self._ensure_flusher()
+
+    def set(self, user_id, product_id, quantity):
+        self.items(user_id)
+        if quantity <= 0:
+            self.backend.delete(user_id, product_id)
+        else:
+            self.backend.put(user_id, product_id, quantity)
+        self._ensure_flusher()
+
+    def remove(self, user_id, product_id):
+        self.items(user_id)
+        self.backend.delete(user_id, product_id)
+        self._ensure_flusher()
+
+    def _acquire(self, user_id, blocking=True):
+        lock = self.backend.lock(user_id)
+        return lock if lock.acquire(blocking=blocking) else None
+
+    def flush(self, user_id):
+        """Write one cart back now"""
+        lock = self._acquire(user_id)
+        if lock is None:
+            raise RuntimeError(f'Cart of user {user_id} is locked by another writer')
+        try:
+            cart = self.backend.get(user_id)
+            if cart is not None:
+                self._write_back({user_id: cart})
+        finally:
+            lock.release()
+
+    def checkout(self, user_id):
+        """Move the cart into the table, and out of the backend, for a checkout that reads and empties the table"""
+        lock = self._acquire(user_id)
+        if lock is None:
+            raise RuntimeError(f'Cart of user {user_id} is locked by another writer')
+        try:
+            # Lines and dirty flag go together, so no flusher can write this cart back over the order
+            cart = self.backend.take(user_id)
+            if cart is not None:
+                try:
+                    self._write_back({user_id: cart})
+                except Exception:
+                    self.backend.fill(user_id, cart)
+                    self.backend.mark_dirty([user_id])
+                    raise
+        finally:
+            lock.release()
+
+    def flush_dirty(self):
+        """Write back every cart changed since the last round; returns how many were written"""
+        written, busy = 0, []
+        try:
+            while True:
+                users = self.backend.pop_dirty(self.batch_size)
+                if not users:
+                    return written
+                # Carts being checked out or flushed by another worker wait for the next round
+                locks = {}
+                for user_id in users:
+                    lock = self._acquire(user_id, blocking=False)
+                    if lock is None:
+                        busy.append(user_id)
+                    else:
+                        locks[user_id] = lock
+                try:
+                    carts = {user_id: self.backend.get(user_id) for user_id in locks}
+                    self._write_back({u: c for u, c in carts.items() if c is not None})
+                except Exception:
+                    self.backend.mark_dirty(list(locks))
+                    raise
+                finally:
+                    for lock in locks.values():
+                        lock.release()
+                written += len(locks)
+        finally:
+            self.backend.mark_dirty(busy)
+
+    def _write_back(self, carts):
+        """Make the cart table match carts exactly: drop lines that are gone, upsert the rest"""
+        if not carts:
+            return
+        dialect = self.engine.dialect.name
+        with self.engine.begin() as conn:
+            product_ids = {p for cart in carts.values() for p in cart}
+            existing = set(conn.execute(
+                select(self.product_table.c.id).where(self.product_table.c.id.in_(product_ids))
+            ).scalars()) if product_ids else set()
+            for user_id, cart in carts.items():
+                # Lines for products deleted meanwhile would break the foreign key
+                lines = {p: q for p, q in cart.items() if p in existing and q > 0}
+                stmt = delete(self.table).where(self.table.c.user_id == user_id)
+                if lines:
+                    stmt = stmt.where(self.table.c.product_id.notin_(lines.keys()))
+                conn.execute(stmt)
+                if lines:
+                    conn.execute(upsert_statement(dialect, self.table, user_id, lines, replace=True))
+
+
+def create_cart_store(url, db, cart_model, product_model, flush_interval=5):
+    """'' keeps carts in the database only; 'memory://' or a redis:// URL enables write-behind"""
+    if not url:
+        return DatabaseCartStore(db, cart_model)
+    backend = MemoryCartBackend() if url.startswith('memory://') else RedisCartBackend(url)
+    return WriteBehindCartStore(backend, db.engine, cart_model, product_model, flush_interval)
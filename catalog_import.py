@@ -0,0 +1,219 @@
+"""
+Bulk product import from CSV or JSON Lines
+
+Rows are read and validated one at a time, then upserted by SKU in batches
+with INSERT ... ON CONFLICT (SQLite and PostgreSQL). Categories are looked
+up by name from a single in-memory map and missing ones are created on the
+fly. Bad rows are reported with their line number and never abort the
+rest of the import.
+"""
+
+import csv
+import json
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+UPDATABLE = ['name', 'description', 'price', 'stock', 'image', 'is_active', 'category_id']
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'off'}
+MAX_ERRORS = 1000
+
+
+class ImportResult:
+    def __init__(self):
+        self.processed = 0
+        self.upserted = 0
+        self.categories_created = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def failed(self):
+        return self.processed - self.upserted
+
+
+def read_rows(stream, fmt):
+    """Yield (line_number, raw_dict) from a text stream; unparsable lines yield (line_number, error string)"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, {k.strip().lower(): v for k, v in row.items() if k}
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(row, dict):
+                yield line_number, 'Expected a JSON object'
+                continue
+            yield line_number, row
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('jsonl', 'ndjson', 'json'):
+        return 'jsonl'
+    return None
+
+
+def _text(raw, field, required=False, max_length=None):
+    value = raw.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f'{field} is required')
+    if max_length and len(value) > max_length:
+        raise ValueError(f'{field} is longer than {max_length} characters')
+    return value
+
+
+def validate(raw):
+    """Turn one raw row into clean column values, raising ValueError with a readable message"""
+    record = {
+        'sku': _text(raw, 'sku', required=True, max_length=64),
+        'name': _text(raw, 'name', required=True, max_length=100),
+        'description': _text(raw, 'description'),
+        'category': _text(raw, 'category', required=True, max_length=100),
+        'image': _text(raw, 'image') or None,
+    }
+    try:
+        record['price'] = float(raw.get('price'))
+    except (TypeError, ValueError):
+        raise ValueError('price must be a number')
+    if record['price'] < 0:
+        raise ValueError('price cannot be negative')
+    try:
+        record['stock'] = int(raw.get('stock') or 0)
+    except (TypeError, ValueError):
+        raise ValueError('stock must be a whole number')
+    if record['stock'] < 0:
+        raise ValueError('stock cannot be negative')
+
+    active = raw.get('is_active')
+    if active is None or active == '':
+        record['is_active'] = True
+    elif isinstance(active, bool):
+        record['is_active'] = active
+    elif str(active).strip().lower() in TRUE_VALUES:
+        record['is_active'] = True
+    elif str(active).strip().lower() in FALSE_VALUES:
+        record['is_active'] = False
+    else:
+        raise ValueError('is_active must be true or false')
+    return record
+
+
+class ProductImporter:
+    def __init__(self, db, product_model, category_model, batch_size=1000, create_categories=True):
+        self.db = db
+        self.Product = product_model
+        self.Category = category_model
+        self.batch_size = batch_size
+        self.create_categories = create_categories
+        self.categories = None
+
+    def _load_categories(self):
+        rows = self.db.session.query(self.Category.id, self.Category.name).all()
+        self.categories = {name.strip().lower(): id for id, name in rows}
+
+    def _resolve_categories(self, batch, result):
+        """Attach category_id to every record, creating unknown categories in one statement"""
+        missing = {}
+        for _, record in batch:
+            key = record['category'].lower()
+            if key not in self.categories:
+                missing.setdefault(key, record['category'])
+        if missing and self.create_categories:
+            now = datetime.utcnow()
+            self.db.session.execute(self.db.insert(self.Category).values([
+                {'name': name, 'description': '', 'is_active': True, 'created_at': now}
+                for name in missing.values()
+            ]))
+            result.categories_created += len(missing)
+            self._load_categories()
+
+        resolved = []
+        for line, record in batch:
+            category_id = self.categories.get(record['category'].lower())
+            if category_id is None:
+                result.add_error(line, f"Unknown category '{record['category']}'")
+                continue
+            record['category_id'] = category_id
+            resolved.append((line, record))
+        return resolved
+
+    def _upsert_statement(self):
+        """INSERT ... ON CONFLICT (sku) DO UPDATE, executed with a list of rows so it compiles once"""
+        table = self.Product.__table__
+        dialect = self.db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            insert = postgresql.insert(table)
+        elif dialect == 'sqlite':
+            insert = sqlite.insert(table)
+        else:
+            raise RuntimeError(f'Bulk import needs INSERT ... ON CONFLICT, which {dialect} does not support')
+        return insert.on_conflict_do_update(
+            index_elements=[table.c.sku],
+            set_={column: insert.excluded[column] for column in UPDATABLE}
+        )
+
+    def _write(self, batch, result):
+        if not batch:
+            return
+        batch = self._resolve_categories(batch, result)
+        # Last occurrence of a SKU wins; ON CONFLICT cannot touch the same row twice in one statement
+        by_sku = {}
+        for line, record in batch:
+            by_sku[record['sku']] = (line, record)
+        now = datetime.utcnow()
+        rows = [(line, {**{k: record[k] for k in UPDATABLE + ['sku']}, 'created_at': now})
+                for line, record in by_sku.values()]
+
+        try:
+            with self.db.session.begin_nested():
+                self.db.session.execute(self.upsert, [r for _, r in rows])
+            result.upserted += len(batch)
+        except Exception:
+            # Isolate the offending rows instead of dropping the whole batch
+            for line, record in rows:
+                try:
+                    with self.db.session.begin_nested():
+                        self.db.session.execute(self.upsert, [record])
+                    result.upserted += 1
+                except Exception as e:
+                    result.add_error(line, str(getattr(e, 'orig', e)).splitlines()[0])
+
+    def run(self, rows):
+        """Import an iterable of (line_number, raw_dict_or_error) and commit once per batch"""
+        result = ImportResult()
+        self._load_categories()
+        self.upsert = self._upsert_statement()
+        batch = []
+        for line, raw in rows:
+            result.processed += 1
+            if isinstance(raw, str):
+                result.add_error(line, raw)
+                continue
+            try:
+                batch.append((line, validate(raw)))
+            except ValueError as e:
+                result.add_error(line, str(e))
+                continue
+            if len(batch) >= self.batch_size:
+                self._write(batch, result)
+                self.db.session.commit()
+                batch = []
+        self._write(batch, result)
+        self.db.session.commit()
+        return result
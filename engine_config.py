@@ -0,0 +1,161 @@
+"""
+SQLAlchemy engine and connection pool configuration
+
+Settings come from an optional JSON file named by DB_CONFIG_FILE and are
+overridden by DB_* environment variables. engine_options() turns them into
+SQLALCHEMY_ENGINE_OPTIONS, and pool_metrics tracks checkouts, connections
+in use and how long requests waited for a connection.
+"""
+
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool, Pool, QueuePool
+
+DEFAULTS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True,
+    'statement_timeout_ms': 0,
+    'pgbouncer': False,
+}
+
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+
+
+def _coerce(name, value):
+    if isinstance(DEFAULTS[name], bool):
+        return value if isinstance(value, bool) else str(value).strip().lower() in TRUE_VALUES
+    return int(value)
+
+
+def load_settings(environ=None):
+    """Merge defaults, the DB_CONFIG_FILE JSON file and DB_<NAME> environment variables, in that order"""
+    environ = os.environ if environ is None else environ
+    settings = dict(DEFAULTS)
+
+    path = environ.get('DB_CONFIG_FILE')
+    if path:
+        with open(path) as f:
+            for name, value in json.load(f).items():
+                if name in DEFAULTS:
+                    settings[name] = _coerce(name, value)
+
+    for name in DEFAULTS:
+        value = environ.get(f'DB_{name.upper()}')
+        if value is not None and value != '':
+            settings[name] = _coerce(name, value)
+    return settings
+
+
+class PoolMetrics:
+    """Process-wide pool counters, fed by pool events and InstrumentedQueuePool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.in_use = 0
+            self.peak_in_use = 0
+            self.connections_opened = 0
+            self.invalidations = 0
+            self.wait_count = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def checked_out(self):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def checked_in(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def connected(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def invalidated(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def waited(self, seconds):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'connections_opened': self.connections_opened,
+                'invalidations': self.invalidations,
+                'wait_avg_ms': self.wait_total / self.wait_count * 1000 if self.wait_count else 0.0,
+                'wait_max_ms': self.wait_max * 1000,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_metrics.waited(time.perf_counter() - start)
+
+
+event.listen(Pool, 'checkout', lambda dbapi_conn, record, proxy: pool_metrics.checked_out())
+event.listen(Pool, 'checkin', lambda dbapi_conn, record: pool_metrics.checked_in())
+event.listen(Pool, 'connect', lambda dbapi_conn, record: pool_metrics.connected())
+event.listen(Pool, 'invalidate', lambda dbapi_conn, record, exc: pool_metrics.invalidated())
+
+
+def engine_options(uri, settings):
+    """Build SQLALCHEMY_ENGINE_OPTIONS for the given database URI"""
+    if uri.startswith('sqlite'):
+        # SQLite connections are local files; pool sizing and timeouts do not apply
+        return {}
+
+    options = {'pool_pre_ping': settings['pool_pre_ping']}
+    if settings['pgbouncer']:
+        # PgBouncer does the pooling; keep no idle connections of our own
+        options['poolclass'] = NullPool
+    else:
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=settings['pool_size'],
+            max_overflow=settings['max_overflow'],
+            pool_timeout=settings['pool_timeout'],
+            pool_recycle=settings['pool_recycle'],
+        )
+        if settings['statement_timeout_ms'] and uri.startswith('postgresql'):
+            options['connect_args'] = {'options': f"-c statement_timeout={settings['statement_timeout_ms']}"}
+    return options
+
+
+def install_engine_events(engine, settings):
+    """Per-transaction statement timeout for PgBouncer, which rejects startup options"""
+    if settings['pgbouncer'] and settings['statement_timeout_ms'] and engine.dialect.name == 'postgresql':
+        timeout = int(settings['statement_timeout_ms'])
+
+        @event.listens_for(engine, 'begin')
+        def set_statement_timeout(conn):
+            conn.exec_driver_sql(f'SET LOCAL statement_timeout = {timeout}')
@@ -0,0 +1,65 @@
+"""
+Streaming order export formats
+
+Each formatter takes an iterable of order-line rows and yields text
+chunks, so an export of any size is written out without ever being held
+in memory. gzip_chunks() compresses such a stream on the fly.
+"""
+
+import csv
+import io
+import json
+import zlib
+
+COLUMNS = [
+    'order_id', 'order_created_at', 'order_status', 'user_id', 'payment_method', 'order_total',
+    'item_id', 'product_id', 'product_name', 'quantity', 'unit_price'
+]
+
+
+def to_record(row):
+    record = dict(zip(COLUMNS, row))
+    if record['order_created_at'] is not None:
+        record['order_created_at'] = record['order_created_at'].isoformat()
+    return record
+
+
+def csv_chunks(rows, batch_size=1000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for count, row in enumerate(rows, 1):
+        record = to_record(row)
+        writer.writerow([record[c] for c in COLUMNS])
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(rows, batch_size=1000):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(to_record(row)))
+        if len(lines) == batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def gzip_chunks(chunks):
+    """Gzip a stream of text chunks incrementally"""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+FORMATS = {
+    'csv': (csv_chunks, 'text/csv'),
+    'ndjson': (ndjson_chunks, 'application/x-ndjson'),
+}
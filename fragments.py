@@ -0,0 +1,48 @@
+"""
+Jinja fragment caching
+
+    {% cache 'product-card', product.id, product.stock %} ... {% endcache %}
+    {% cache 'home-categories', ttl=300 %} ... {% endcache %}
+
+The rendered HTML of the block is stored under a key made of its arguments
+in the catalog cache (local LRU plus the optional shared store), so every
+admin change that invalidates the catalog also retires every fragment.
+Key arguments must cover anything the block shows that can change without
+a catalog invalidation (stock, for instance).
+"""
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        # Set by the app: any object with get_or_set(name, loader, ttl); None renders blocks uncached
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts, ttl = [], nodes.Const(None)
+        while parser.stream.current.type != 'block_end':
+            if parts:
+                parser.stream.expect('comma')
+            if parser.stream.current.test('name:ttl') and parser.stream.look().test('assign'):
+                next(parser.stream)
+                next(parser.stream)
+                ttl = parser.parse_expression()
+            else:
+                parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_render', [nodes.List(parts), ttl])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, ttl, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key = 'fragment:' + ':'.join(str(part) for part in parts)
+        return Markup(cache.get_or_set(key, lambda: str(caller()), ttl))
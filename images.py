@@ -0,0 +1,126 @@
+"""
+Uploaded image storage and responsive variants
+
+ImagePipeline.store() streams an upload to disk under a name derived from
+the SHA-256 of its contents, so identical uploads share one file and a URL
+never changes meaning (safe to cache forever). build_variants() then writes
+resized copies at each configured width, as WebP and as a JPEG fallback,
+plus a small manifest listing what was made; it is meant to run off the
+request thread (the app queues it as a background job). Until the manifest
+exists, sources() serves the original upload, so pages never wait on it.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+VARIANT_FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+
+
+class ImagePipeline:
+    def __init__(self, upload_folder, widths=(200, 400, 800), quality=80, url_prefix='/static/uploads/'):
+        self.upload_folder = upload_folder
+        self.widths = tuple(sorted(widths))
+        self.quality = quality
+        self.url_prefix = url_prefix
+        # Manifests never change once written (content-addressed), so found ones are cached for good
+        self._manifests = {}
+        self._lock = threading.Lock()
+
+    def store(self, file_storage, folder):
+        """Save an upload as <folder>/<hash>.<ext>; returns that path relative to the upload folder"""
+        ext = os.path.splitext(file_storage.filename)[1].lower().lstrip('.')
+        ext = 'jpg' if ext == 'jpeg' else ext
+        directory = os.path.join(self.upload_folder, folder)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: file_storage.stream.read(1 << 16), b''):
+                    digest.update(chunk)
+                    out.write(chunk)
+            path = f'{folder}/{digest.hexdigest()[:32]}.{ext}'
+            target = os.path.join(self.upload_folder, path)
+            if os.path.exists(target):
+                os.remove(tmp)
+            else:
+                os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return path
+
+    def _variant_path(self, path, width, ext):
+        return f'{os.path.splitext(path)[0]}-{width}.{ext}'
+
+    def _manifest_file(self, path):
+        return os.path.join(self.upload_folder, os.path.splitext(path)[0] + '.json')
+
+    def build_variants(self, path):
+        """Write the resized WebP/JPEG copies of an original and its manifest; skipped if already built"""
+        from PIL import Image, ImageOps
+
+        manifest_file = self._manifest_file(path)
+        if os.path.exists(manifest_file):
+            return
+        with Image.open(os.path.join(self.upload_folder, path)) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode not in ('RGB', 'RGBA'):
+                original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+            # Never upscale: widths past the original collapse into one variant at its own width
+            widths = sorted({min(width, original.width) for width in self.widths})
+            for width in widths:
+                height = max(1, round(original.height * width / original.width))
+                resized = original.resize((width, height), Image.LANCZOS) if width != original.width else original
+                for ext, fmt in VARIANT_FORMATS:
+                    image = resized.convert('RGB') if fmt == 'JPEG' else resized
+                    self._save(image, self._variant_path(path, width, ext), fmt)
+        self._write_atomic(manifest_file, json.dumps({'widths': widths}).encode())
+
+    def _save(self, image, path, fmt):
+        target = os.path.join(self.upload_folder, path)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.part')
+        with os.fdopen(fd, 'wb') as out:
+            image.save(out, fmt, quality=self.quality, optimize=True)
+        os.replace(tmp, target)
+
+    def _write_atomic(self, target, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.part')
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        os.replace(tmp, target)
+
+    def manifest(self, path):
+        cached = self._manifests.get(path)
+        if cached is not None:
+            return cached
+        try:
+            with open(self._manifest_file(path)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._manifests[path] = manifest
+        return manifest
+
+    def url(self, path):
+        """Public URL for a stored image path; external and data: URLs pass through"""
+        if not path or path.startswith(('http://', 'https://', 'data:', '/')):
+            return path
+        return self.url_prefix + path
+
+    def sources(self, path):
+        """src plus WebP and JPEG srcset strings for a <picture>; srcsets are empty until variants exist"""
+        sources = {'src': self.url(path), 'webp': '', 'jpeg': ''}
+        manifest = self.manifest(path) if sources['src'] != path else None
+        if manifest:
+            widths = manifest['widths']
+            for key, ext in (('webp', 'webp'), ('jpeg', 'jpg')):
+                sources[key] = ', '.join(f'{self.url(self._variant_path(path, w, ext))} {w}w' for w in widths)
+            # Largest JPEG as the plain fallback: smaller than an unbounded original, decodable everywhere
+            sources['src'] = self.url(self._variant_path(path, widths[-1], 'jpg'))
+        return sources
@@ -4,26 +4,31 @@ Ultimate database initializer with automatic migration
 
 import os
 from app import app, db
-from sqlalchemy import text
 
 def create_database():
     with app.app_context():
         print("🚀 Starting database setup...")
         
         try:
-            # FIRST: Add is_active columns using raw SQL (before any queries)
-            add_is_active_columns_raw()
-            
-            # THEN: Create all tables based on models
+            # FIRST: Create any missing tables based on models
             db.create_all()
             print("✅ All tables created successfully")
             
+            # THEN: Add columns and indexes that older databases are missing
+            run_migrations()
+            
             # Create admin user
             create_admin()
             
             # Create sample data
             create_sample_data()
             
+            # Build the product search index
+            rebuild_search_index()
+            
+            # Reconcile the dashboard counters with the tables
+            rebuild_stats()
+            
             # List all tables in database
             from sqlalchemy import inspect
             inspector = inspect(db.engine)
@@ -39,44 +44,14 @@ def create_database():
         print("🎉 Database setup completed!")
         return True
 
-def add_is_active_columns_raw():
-    """Add is_active columns using raw SQL before any ORM queries"""
-    print("🔄 Adding is_active columns...")
+def run_migrations():
+    """Bring existing tables up to date with the versioned migrations in migrations.py"""
+    import migrations
     
-    with db.engine.connect() as conn:
-        try:
-            # Check and add is_active to category table
-            result = conn.execute(text("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name='category' AND column_name='is_active'
-            """))
-            
-            if result.rowcount == 0:
-                conn.execute(text('ALTER TABLE category ADD COLUMN is_active BOOLEAN DEFAULT TRUE'))
-                conn.commit()
-                print("  ✅ Added is_active to category table")
-            else:
-                print("  ℹ️  is_active already exists in category table")
-        except Exception as e:
-            print(f"  ℹ️  Category migration: {str(e)}")
-        
-        try:
-            # Check and add is_active to product table
-            result = conn.execute(text("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name='product' AND column_name='is_active'
-            """))
-            
-            if result.rowcount == 0:
-                conn.execute(text('ALTER TABLE product ADD COLUMN is_active BOOLEAN DEFAULT TRUE'))
-                conn.commit()
-                print("  ✅ Added is_active to product table")
-            else:
-                print("  ℹ️  is_active already exists in product table")
-        except Exception as e:
-            print(f"  ℹ️  Product migration: {str(e)}")
+    print("🔄 Applying schema migrations...")
+    applied = migrations.upgrade(db.engine)
+    if not applied:
+        print("  ℹ️  Schema is already up to date")
 
 def create_admin():
     """Create admin user if not exists"""
@@ -105,7 +80,7 @@ def create_admin():
 
 def create_sample_data():
     """Create sample categories and products"""
-    from app import Category, Product
+    from app import Category, Product, run_product_import
     
     try:
         # Check if data already exists
@@ -125,13 +100,9 @@ def create_sample_data():
             {'name': 'Bakery', 'description': 'Bread and bakery items', 'image': 'https://images.unsplash.com/photo-1509440159596-0249088772ff?w=400'}
         ]
         
-        categories = {}
-        for cat_data in categories_data:
-            category = Category(**cat_data)
-            db.session.add(category)
-            db.session.flush()
-            categories[cat_data['name']] = category
-            print(f"  ✅ Created category: {cat_data['name']}")
+        db.session.add_all(Category(**cat_data) for cat_data in categories_data)
+        db.session.commit()
+        print(f"  ✅ Created categories: {', '.join(c['name'] for c in categories_data)}")
         
         # Sample Products
         products_data = [
@@ -165,16 +136,15 @@ def create_sample_data():
             {'name': 'Croissant', 'description': 'Butter croissant - 4 pcs', 'price': 120, 'stock': 40, 'category': 'Bakery', 'image': 'https://images.unsplash.com/photo-1555507036-ab1f4038808a?w=400'},
         ]
         
-        for prod_data in products_data:
-            category_name = prod_data.pop('category')
-            product = Product(
-                **prod_data,
-                category_id=categories[category_name].id
-            )
-            db.session.add(product)
-            print(f"  ✅ Created product: {prod_data['name']}")
+        rows = [
+            (line, {**prod_data, 'sku': 'SAMPLE-' + prod_data['name'].upper().replace(' ', '-')})
+            for line, prod_data in enumerate(products_data, 1)
+        ]
+        result = run_product_import(rows, create_categories=False)
+        for line, message in result.errors:
+            print(f"  ⚠️  Product {line}: {message}")
+        print(f"  ✅ Created products: {', '.join(p['name'] for p in products_data)}")
         
-        db.session.commit()
         print("✅ Sample data created successfully!")
         print(f"  📊 Created {len(categories_data)} categories")
         print(f"  📊 Created {len(products_data)} products")
@@ -183,6 +153,27 @@ def create_sample_data():
         print(f"⚠️  Sample data creation: {str(e)}")
         db.session.rollback()
 
+def rebuild_search_index():
+    """Create the full-text search index and repopulate it from the product table"""
+    from app import search_index
+    
+    try:
+        search_index().rebuild()
+        print("🔎 Product search index rebuilt")
+    except Exception as e:
+        print(f"⚠️  Search index rebuild: {str(e)}")
+
+def rebuild_stats():
+    """Recompute the admin dashboard counters"""
+    from app import rebuild_store_stats
+    
+    try:
+        rebuild_store_stats()
+        print("📊 Dashboard counters rebuilt")
+    except Exception as e:
+        print(f"⚠️  Dashboard counters: {str(e)}")
+        db.session.rollback()
+
 if __name__ == '__main__':
     success = create_database()
     exit(0 if success else 1)
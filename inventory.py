@@ -0,0 +1,125 @@
+"""
+Inventory forecasting and reorder suggestions
+
+run() estimates each product's daily demand from the last history_days
+complete days of the sales rollups (sales_daily_product, see analytics.py):
+an exponentially weighted mean of units sold per day with a half-life of
+half_life days, over the days the product has existed. A product needs
+reordering once its stock is at or below the demand expected during the
+supplier lead time plus a safety stock of z standard deviations of daily
+demand; the suggested quantity brings it up to lead time plus cover_days
+of demand. Everything is computed on NumPy arrays indexed by product id,
+filled one day of rollups at a time, so a run is linear in the rollup rows
+and needs a few arrays of (highest product id) entries in memory. The
+previous suggestions are replaced in the same transaction as the new ones.
+"""
+
+import math
+from datetime import datetime, timedelta
+from itertools import chain
+
+from sqlalchemy import func, select
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class InventoryForecast:
+    def __init__(self, db, product_model, product_daily_model, suggestion_model, history_days=56,
+                 half_life=14, lead_time_days=7, cover_days=14, z=1.65, batch_size=10000):
+        self.db = db
+        self.Product = product_model
+        self.ProductDaily = product_daily_model
+        self.Suggestion = suggestion_model
+        self.history_days = history_days
+        self.half_life = half_life
+        self.lead_time_days = lead_time_days
+        self.cover_days = cover_days
+        # 1.65 standard deviations covers about 95% of lead-time demand
+        self.z = z
+        self.batch_size = batch_size
+
+    def _products(self, size, today):
+        """Dense stock, active flag and days of history per product id"""
+        Product = self.Product
+        stock = np.zeros(size)
+        active = np.zeros(size, dtype=bool)
+        days = np.full(size, float(self.history_days))
+        rows = self.db.session.execute(
+            select(Product.id, Product.stock, Product.is_active, Product.created_at)
+            .execution_options(yield_per=self.batch_size)
+        )
+        for batch in rows.partitions():
+            ids = np.fromiter((row[0] for row in batch), dtype=np.int64, count=len(batch))
+            stock[ids] = [row[1] for row in batch]
+            active[ids] = [row[2] is not False for row in batch]
+            # A product added last week has a week of history, not history_days of zero sales
+            days[ids] = [min(self.history_days, max(1, (today - row[3].date()).days)) if row[3]
+                         else self.history_days for row in batch]
+        return stock, active, days
+
+    def run(self, today=None):
+        """Recompute every product's forecast and replace the stored suggestions; returns how many were stored"""
+        if np is None:
+            raise RuntimeError('Inventory forecasting needs NumPy: pip install numpy')
+        ProductDaily, session = self.ProductDaily, self.db.session
+        today = today or datetime.utcnow().date()
+        size = (session.execute(select(func.max(self.Product.id))).scalar() or 0) + 1
+        stock, active, history = self._products(size, today)
+
+        decay = 0.5 ** (1 / self.half_life)
+        weighted = np.zeros(size)
+        total = np.zeros(size)
+        squares = np.zeros(size)
+        recent = np.zeros(size)
+        # Yesterday has age 1; today is still being sold and is left out
+        for age in range(1, self.history_days + 1):
+            rows = session.execute(
+                select(ProductDaily.product_id, ProductDaily.units)
+                .where(ProductDaily.day == today - timedelta(days=age), ProductDaily.units > 0)
+            ).all()
+            if not rows:
+                continue
+            # Flattened rather than np.array(rows): numpy probes Row objects one item at a time
+            ids, units = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=2 * len(rows)).reshape(-1, 2).T
+            ids = ids.astype(np.int64)
+            keep = ids < size
+            ids, units = ids[keep], units[keep]
+            # Products younger than this day have no history on it
+            counted = history[ids] >= age
+            ids, units = ids[counted], units[counted]
+            np.add.at(weighted, ids, units * decay ** (age - 1))
+            np.add.at(total, ids, units)
+            np.add.at(squares, ids, units * units)
+            if age <= 7:
+                np.add.at(recent, ids, units)
+
+        # Sum of the weights over each product's days of history (a geometric series)
+        velocity = weighted * (1 - decay) / (1 - decay ** history)
+        mean = total / history
+        std = np.sqrt(np.maximum(squares / history - mean * mean, 0))
+        safety = self.z * std * math.sqrt(self.lead_time_days)
+        reorder_point = velocity * self.lead_time_days + safety
+        target = velocity * (self.lead_time_days + self.cover_days) + safety
+        needed = np.flatnonzero(active & (velocity > 0) & (stock <= reorder_point))
+        cover = np.maximum(stock[needed], 0) / velocity[needed]
+
+        Suggestion = self.Suggestion
+        now = datetime.utcnow()
+        session.execute(Suggestion.__table__.delete())
+        rows = [
+            {'product_id': int(product_id), 'stock': int(stock[product_id]),
+             'velocity': float(velocity[product_id]),
+             'recent_velocity': float(recent[product_id] / min(7, history[product_id])),
+             'days_of_cover': float(days), 'stockout_date': today + timedelta(days=int(days)),
+             'reorder_point': float(reorder_point[product_id]),
+             'suggested_quantity': max(1, math.ceil(target[product_id] - stock[product_id])),
+             'computed_at': now}
+            for product_id, days in zip(needed.tolist(), cover.tolist())
+        ]
+        for i in range(0, len(rows), self.batch_size):
+            session.execute(Suggestion.__table__.insert(), rows[i:i + self.batch_size])
+        session.commit()
+        return len(rows)
@@ -0,0 +1,187 @@
+"""
+Durable background job queue
+
+Request handlers call JobQueue.enqueue() inside their own transaction, so a
+job exists exactly when the change that caused it is committed. An optional
+idempotency key makes repeated enqueues of the same event a no-op. Workers
+(`flask jobs-worker`, or threads inside the web process) claim due jobs with
+a conditional UPDATE, run the registered handler, and on failure retry with
+exponential backoff until max_attempts. Delivery is at-least-once: a worker
+that dies mid-job leaves it to be reclaimed after the visibility timeout.
+"""
+
+import json
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+class JobQueue:
+    def __init__(self, db, job_model, retry_base=30, retry_max=3600, visibility_timeout=600):
+        self.db = db
+        self.Job = job_model
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.visibility_timeout = visibility_timeout
+        self.handlers = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def handler(self, kind):
+        """Register fn(payload) as the handler for jobs of this kind"""
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    def enqueue(self, kind, payload=None, key=None, delay=0, max_attempts=5):
+        """Add a job in the caller's transaction; a job with the same idempotency key is left as is"""
+        table = self.Job.__table__
+        dialect = self.db.session.get_bind().dialect.name
+        stmt = (postgresql if dialect == 'postgresql' else sqlite).insert(table).values(
+            kind=kind,
+            payload=json.dumps(payload or {}),
+            idempotency_key=key,
+            status='queued',
+            attempts=0,
+            max_attempts=max_attempts,
+            run_at=datetime.utcnow() + timedelta(seconds=delay),
+            created_at=datetime.utcnow()
+        )
+        self.db.session.execute(stmt.on_conflict_do_nothing(index_elements=['idempotency_key']))
+
+    def _due(self, now):
+        Job = self.Job
+        return or_(
+            (Job.status == 'queued') & (Job.run_at <= now),
+            # Claimed by a worker that never reported back
+            (Job.status == 'running') & (Job.locked_at < now - timedelta(seconds=self.visibility_timeout))
+        )
+
+    def claim(self, worker_id, limit=10):
+        """Take up to limit due jobs for this worker; each claim is a conditional UPDATE, so only one worker wins"""
+        Job = self.Job
+        now = datetime.utcnow()
+        session = self.db.session
+        candidates = session.execute(
+            select(Job.id).where(self._due(now)).order_by(Job.run_at).limit(limit)
+        ).scalars().all()
+        claimed = []
+        for job_id in candidates:
+            won = session.execute(
+                update(Job)
+                .where(Job.id == job_id, self._due(now))
+                .values(status='running', locked_at=now, locked_by=worker_id, attempts=Job.attempts + 1)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if won:
+                claimed.append(job_id)
+        session.commit()
+        if not claimed:
+            return []
+        return session.execute(
+            select(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts).where(Job.id.in_(claimed))
+        ).all()
+
+    def _backoff(self, attempts):
+        delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+        return delay * random.uniform(1.0, 1.2)
+
+    def run_job(self, job, worker_id):
+        Job = self.Job
+        session = self.db.session
+        try:
+            handler = self.handlers.get(job.kind)
+            if handler is None:
+                raise LookupError(f'No handler registered for {job.kind!r}')
+            handler(json.loads(job.payload))
+            session.commit()
+            values = {'status': 'done', 'finished_at': datetime.utcnow(), 'last_error': None}
+        except Exception:
+            session.rollback()
+            error = traceback.format_exc(limit=5)
+            if job.attempts >= job.max_attempts:
+                values = {'status': 'failed', 'finished_at': datetime.utcnow(), 'last_error': error}
+            else:
+                retry_at = datetime.utcnow() + timedelta(seconds=self._backoff(job.attempts))
+                values = {'status': 'queued', 'run_at': retry_at, 'last_error': error}
+        # Only record the outcome if the job was not reclaimed by another worker meanwhile
+        session.execute(
+            update(Job).where(Job.id == job.id, Job.locked_by == worker_id).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        return values['status']
+
+    def run_once(self, worker_id, limit=10):
+        """Claim and run one batch; returns the number of jobs handled"""
+        jobs = self.claim(worker_id, limit)
+        for job in jobs:
+            self.run_job(job, worker_id)
+        return len(jobs)
+
+    def work(self, app, threads=1, poll_interval=1.0, stop=None):
+        """Run worker threads until stop is set (forever if None)"""
+        stop = stop or threading.Event()
+        base_id = f'{socket.gethostname()}:{os.getpid()}'
+
+        def loop(n):
+            worker_id = f'{base_id}:{n}'
+            while not stop.is_set():
+                try:
+                    with app.app_context():
+                        handled = self.run_once(worker_id)
+                except Exception:
+                    app.logger.exception('Job worker %s failed to poll', worker_id)
+                    handled = 0
+                if not handled:
+                    stop.wait(poll_interval)
+
+        workers = [threading.Thread(target=loop, args=(n,), name=f'job-worker-{n}', daemon=True)
+                   for n in range(threads)]
+        for worker in workers:
+            worker.start()
+        return stop, workers
+
+    def ensure_workers(self, app, threads, poll_interval=1.0):
+        """Start in-process workers once per process (gunicorn forks after import)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self.work(app, threads, poll_interval)
+
+    def stats(self):
+        rows = self.db.session.execute(
+            select(self.Job.status, func.count()).group_by(self.Job.status)
+        ).all()
+        return {status: count for status, count in rows}
+
+    def prune(self, older_than_days):
+        """Delete finished jobs older than the given age; failed jobs are kept for inspection"""
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        deleted = self.db.session.execute(
+            self.Job.__table__.delete()
+            .where(self.Job.status == 'done', self.Job.finished_at < cutoff)
+        ).rowcount
+        self.db.session.commit()
+        return deleted
+
+
+def wait_for(stop, workers):
+    """Block until Ctrl-C, then let workers finish their current job"""
+    try:
+        while any(w.is_alive() for w in workers):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,124 @@
+"""
+Versioned schema migrations
+
+Each migration is a numbered function that brings an existing database up
+to date. Applied versions are recorded in the schema_migrations table, so
+upgrade() only runs what is missing. Steps are written to be idempotent and
+to work on both SQLite and PostgreSQL; indexes are built with
+CREATE INDEX CONCURRENTLY on PostgreSQL so tables stay writable meanwhile.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def has_table(conn, table):
+    return inspect(conn).has_table(table)
+
+
+def has_column(conn, table, column):
+    return column in [c['name'] for c in inspect(conn).get_columns(table)]
+
+
+def add_column(conn, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the table is missing (create_all will make it) or already has it"""
+    if has_table(conn, table) and not has_column(conn, table, column):
+        quote = conn.dialect.identifier_preparer.quote
+        conn.execute(text(f'ALTER TABLE {quote(table)} ADD COLUMN {quote(column)} {ddl}'))
+
+
+def create_index(conn, name, table, columns, unique=False):
+    """CREATE INDEX IF NOT EXISTS, concurrently on PostgreSQL"""
+    if not has_table(conn, table):
+        return
+    quote = conn.dialect.identifier_preparer.quote
+    concurrently = ' CONCURRENTLY' if conn.dialect.name == 'postgresql' else ''
+    conn.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX{concurrently} IF NOT EXISTS {quote(name)} "
+        f"ON {quote(table)} ({', '.join(quote(c) for c in columns)})"
+    ))
+
+
+@migration(1, 'Add is_active to category and product')
+def add_is_active_columns(conn):
+    add_column(conn, 'category', 'is_active', 'BOOLEAN DEFAULT TRUE')
+    add_column(conn, 'product', 'is_active', 'BOOLEAN DEFAULT TRUE')
+
+
+@migration(2, 'Add product.sku')
+def add_product_sku(conn):
+    add_column(conn, 'product', 'sku', 'VARCHAR(64)')
+    create_index(conn, 'ix_product_sku', 'product', ['sku'], unique=True)
+
+
+@migration(3, 'Index hot query paths')
+def add_hot_path_indexes(conn):
+    # Cart(user_id) lookups are already served by the (user_id, product_id) unique constraint
+    create_index(conn, 'ix_product_active_category', 'product', ['is_active', 'category_id'])
+    create_index(conn, 'ix_order_user_created', 'order', ['user_id', 'created_at'])
+    create_index(conn, 'ix_order_status_created', 'order', ['status', 'created_at'])
+    create_index(conn, 'ix_order_created', 'order', ['created_at', 'id'])
+    create_index(conn, 'ix_order_item_order_id', 'order_item', ['order_id'])
+    create_index(conn, 'ix_order_item_product_id', 'order_item', ['product_id'])
+
+
+@migration(4, 'Index product listing sorts')
+def add_product_sort_indexes(conn):
+    create_index(conn, 'ix_product_active_created', 'product', ['is_active', 'created_at', 'id'])
+    create_index(conn, 'ix_product_active_price', 'product', ['is_active', 'price', 'id'])
+    create_index(conn, 'ix_product_active_name', 'product', ['is_active', 'name', 'id'])
+
+
+@migration(5, 'Add order summary columns')
+def add_order_summary_columns(conn):
+    # Existing orders are filled in by app.fill_order_summaries() (flask db-upgrade runs it)
+    add_column(conn, 'order', 'item_count', 'INTEGER')
+    add_column(conn, 'order', 'item_summary', 'TEXT')
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)'
+    ))
+
+
+def applied_versions(conn):
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def pending(engine):
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+        conn.commit()
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def upgrade(engine, log=print):
+    """Apply every pending migration in order, recording each one as it completes"""
+    applied = []
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        done = applied_versions(conn)
+        for version, name, fn in MIGRATIONS:
+            if version in done:
+                continue
+            log(f'  ⏫ Migration {version}: {name}')
+            fn(conn)
+            conn.execute(
+                text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)'),
+                {'v': version, 'n': name, 't': datetime.utcnow()}
+            )
+            applied.append(version)
+    return applied
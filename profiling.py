@@ -0,0 +1,228 @@
+"""
+Per-request SQL profiling and Prometheus metrics
+
+RequestProfiler hooks SQLAlchemy's before/after_cursor_execute and Flask's
+before/after_request to count queries and database time for each request,
+adds them to per-endpoint totals, and logs any statement slower than a
+threshold together with its route and normalized SQL. The hot path is two
+perf_counter() calls, a context variable lookup and two additions per
+statement; SQL normalization only runs for slow statements.
+
+Totals live in each process. Given a snapshot_dir, a background thread in
+every worker writes that worker's totals to its own file there once a
+second, and collect() adds up all the files, so a scrape answered by any
+gunicorn worker reports the whole service. Files of exited workers stay and
+keep counting, so totals never go backwards while the directory lives;
+empty it when the server starts.
+"""
+
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger('grocery.sql')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_PARAM_RE = re.compile(r'%\(\w+\)s|%s|:\w+|\$\d+|__\[POSTCOMPILE_\w+\]')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """Collapse whitespace and replace literals, bound parameters and IN lists with ?"""
+    statement = _STRING_RE.sub('?', statement)
+    statement = _PARAM_RE.sub('?', statement)
+    statement = _NUMBER_RE.sub('?', statement)
+    statement = _IN_LIST_RE.sub('(...)', statement)
+    return _SPACE_RE.sub(' ', statement).strip()
+
+
+class EndpointStats:
+    __slots__ = ('requests', 'request_seconds', 'queries', 'db_seconds', 'slow_queries', 'max_queries')
+
+    def __init__(self):
+        self.requests = 0
+        self.request_seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slow_queries = 0
+        self.max_queries = 0
+
+
+class RequestProfiler:
+    """Aggregates per-endpoint request, query and DB-time counters"""
+
+    def __init__(self, slow_query_ms=200, snapshot_dir=None, snapshot_interval=1.0):
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_interval = snapshot_interval
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._snapshot_path = None
+        # [started, queries, db seconds] for the request being served in this context
+        self._current = ContextVar('sql_profile', default=None)
+
+    def init_app(self, app, *engines):
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _start_request(self):
+        self._current.set([time.perf_counter(), 0, 0.0])
+
+    def _finish_request(self, response):
+        current = self._current.get()
+        if current is None:
+            return response
+        self._current.set(None)
+        started, queries, db_seconds = current
+        with self._lock:
+            stats = self._endpoint_stats(request.endpoint or 'unmatched')
+            stats.requests += 1
+            stats.request_seconds += time.perf_counter() - started
+            stats.queries += queries
+            stats.db_seconds += db_seconds
+            stats.max_queries = max(stats.max_queries, queries)
+        if self.snapshot_dir:
+            self._ensure_writer()
+        return response
+
+    def _ensure_writer(self):
+        # Started lazily and per process, so gunicorn workers forked from a preloaded app each get one
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Start time in the name so a recycled pid never overwrites an exited worker's totals
+            self._snapshot_path = os.path.join(self.snapshot_dir, f'profile-{self._pid}-{time.time_ns()}.json')
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        threading.Thread(target=self._run_writer, name='profile-writer', daemon=True).start()
+        atexit.register(self.write_snapshot)
+
+    def _run_writer(self):
+        while True:
+            time.sleep(self.snapshot_interval)
+            try:
+                self.write_snapshot()
+            except OSError:
+                pass
+
+    def write_snapshot(self):
+        """Replace this worker's file in snapshot_dir with its current totals"""
+        path = self._snapshot_path
+        if path is None:
+            return
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+    def _endpoint_stats(self, endpoint):
+        stats = self._stats.get(endpoint)
+        if stats is None:
+            stats = self._stats[endpoint] = EndpointStats()
+        return stats
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_started'] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.pop('query_started', time.perf_counter())
+        current = self._current.get()
+        if current is not None:
+            current[1] += 1
+            current[2] += elapsed
+        if elapsed >= self.slow_query_seconds:
+            self._log_slow_query(statement, elapsed, current is not None)
+
+    def _log_slow_query(self, statement, elapsed, in_request):
+        endpoint = request.endpoint if in_request and has_request_context() else None
+        if endpoint:
+            with self._lock:
+                self._endpoint_stats(endpoint).slow_queries += 1
+        logger.warning('slow query %.1f ms on %s: %s', elapsed * 1000, endpoint or '-', normalize_sql(statement))
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {attr: getattr(stats, attr) for attr in EndpointStats.__slots__}
+                    for name, stats in self._stats.items()}
+
+    def collect(self):
+        """Per-endpoint totals of every worker sharing snapshot_dir, or of this process without one"""
+        if not self.snapshot_dir:
+            return self.snapshot()
+        # Our own totals straight from memory; other workers' files are at most snapshot_interval old
+        totals = self.snapshot()
+        try:
+            names = os.listdir(self.snapshot_dir)
+        except OSError:
+            names = []
+        own = os.path.basename(self._snapshot_path or '')
+        for name in names:
+            if name == own or not (name.startswith('profile-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.snapshot_dir, name)) as f:
+                    worker = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for endpoint, stats in worker.items():
+                merged = totals.setdefault(endpoint, dict.fromkeys(EndpointStats.__slots__, 0))
+                for attr in EndpointStats.__slots__:
+                    value = stats.get(attr, 0)
+                    merged[attr] = max(merged[attr], value) if attr == 'max_queries' else merged[attr] + value
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in (labels or {}).items())
+
+
+def render_prometheus(endpoint_stats=None, gauges=None, labels=None):
+    """Prometheus text exposition: per-endpoint counters plus any extra {name: (help, value)} gauges.
+
+    labels ({name: value}) are added to every series, e.g. a worker label
+    for numbers that only cover the process answering the scrape.
+    """
+    metrics = [
+        ('http_requests_total', 'counter', 'Requests served', 'requests'),
+        ('http_request_duration_seconds_total', 'counter', 'Time spent serving requests', 'request_seconds'),
+        ('db_queries_total', 'counter', 'SQL statements executed', 'queries'),
+        ('db_query_duration_seconds_total', 'counter', 'Time spent in SQL statements', 'db_seconds'),
+        ('db_slow_queries_total', 'counter', 'SQL statements over the slow query threshold', 'slow_queries'),
+        ('db_queries_per_request_max', 'gauge', 'Most SQL statements issued by a single request', 'max_queries'),
+    ]
+    extra = _labels(labels)
+    lines = []
+    for name, kind, help_text, attr in (metrics if endpoint_stats is not None else ()):
+        lines.append(f'# HELP grocery_{name} {help_text}')
+        lines.append(f'# TYPE grocery_{name} {kind}')
+        for endpoint in sorted(endpoint_stats):
+            series = f'endpoint="{_escape(endpoint)}"' + (f',{extra}' if extra else '')
+            lines.append(f'grocery_{name}{{{series}}} {endpoint_stats[endpoint][attr]}')
+    for name, (help_text, value) in (gauges or {}).items():
+        lines.append(f'# HELP grocery_{name} {help_text}')
+        lines.append(f'# TYPE grocery_{name} gauge')
+        lines.append(f'grocery_{name}{{{extra}}} {value}' if extra else f'grocery_{name} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,86 @@
+"""
+EXPLAIN-based regression check for route queries
+
+Requests a list of URLs through the Flask test client, records every SELECT
+they issue, and asks the database for each statement's plan. Any full table
+scan (SQLite "SCAN <table>" without an index, PostgreSQL "Seq Scan" with
+enable_seqscan off) on a table outside ALLOWED_SCAN_TABLES is reported.
+"""
+
+import re
+
+from sqlalchemy import event
+
+# Small lookup tables (and SQLite's catalog) where a full scan is the intended plan
+ALLOWED_SCAN_TABLES = {'category', 'store_stats', 'daily_order_stats', 'schema_migrations', 'sqlite_master'}
+
+SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\S+)')
+POSTGRES_SCAN_RE = re.compile(r'Seq Scan on (\S+)')
+# SQLAlchemy's anonymous subquery aliases; SQLite reports reading them back as a SCAN
+SUBQUERY_ALIAS_RE = re.compile(r'^anon_\d+$')
+
+
+def explain(conn, statement, parameters):
+    if conn.dialect.name == 'postgresql':
+        rows = conn.exec_driver_sql(f'EXPLAIN {statement}', parameters)
+        return [row[0] for row in rows]
+    rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+    return [row[-1] for row in rows]
+
+
+def sequential_scans(dialect, plan):
+    tables = []
+    for line in plan:
+        if dialect == 'postgresql':
+            match = POSTGRES_SCAN_RE.search(line)
+        else:
+            match = SQLITE_SCAN_RE.match(line.strip())
+            if match and ('USING' in line or 'VIRTUAL TABLE' in line):
+                match = None
+        if match:
+            table = match.group(1).strip('"')
+            if table not in ALLOWED_SCAN_TABLES and not SUBQUERY_ALIAS_RE.match(table):
+                tables.append(table)
+    return tables
+
+
+def capture_statements(app, engine, urls, session_data=None):
+    """Return [(url, statement, parameters)] for every SELECT issued while serving urls"""
+    captured = []
+    current = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            captured.append((current['url'], statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        client = app.test_client()
+        if session_data:
+            with client.session_transaction() as sess:
+                sess.update(session_data)
+        for url in urls:
+            current['url'] = url
+            client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return captured
+
+
+def check(app, engine, urls, session_data=None):
+    """Return [(url, table, statement)] for each disallowed sequential scan"""
+    captured = capture_statements(app, engine, urls, session_data)
+    offenders = []
+    seen = set()
+    with engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Make the planner use any usable index, so a Seq Scan means none exists
+            conn.exec_driver_sql('SET enable_seqscan = off')
+        for url, statement, parameters in captured:
+            if (url, statement) in seen:
+                continue
+            seen.add((url, statement))
+            for table in sequential_scans(conn.dialect.name, explain(conn, statement, parameters)):
+                offenders.append((url, table, statement))
+        conn.rollback()
+    return offenders
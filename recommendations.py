@@ -0,0 +1,177 @@
+"""
+Co-purchase ("frequently bought together") index
+
+Every ordered pair of distinct products that appear in the same order adds
+one to product_pair(product_id, other_id).orders. update() folds in the
+orders placed since its watermark, a batch at a time, then rewrites the
+product_recommendation row of each product it touched with the ids of its
+top partners, so product pages read their recommendations with a single
+primary-key lookup. Pair counting is vectorized with NumPy when it is
+installed and done with plain Python otherwise.
+"""
+
+import json
+from datetime import datetime, timedelta
+from itertools import permutations
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+WATERMARK = 'co_purchase'
+
+
+def co_occurrences(order_ids, product_ids):
+    """[(product, other, orders)] for rows of distinct (order, product) pairs sorted by order"""
+    if not order_ids:
+        return []
+    if np is None:
+        counts = {}
+        start = 0
+        for end in range(1, len(order_ids) + 1):
+            if end == len(order_ids) or order_ids[end] != order_ids[start]:
+                for pair in permutations(product_ids[start:end], 2):
+                    counts[pair] = counts.get(pair, 0) + 1
+                start = end
+        return [(a, b, n) for (a, b), n in counts.items()]
+
+    orders = np.asarray(order_ids, dtype=np.int64)
+    products = np.asarray(product_ids, dtype=np.int64)
+    _, starts, sizes = np.unique(orders, return_index=True, return_counts=True)
+    # Pair every row with every row of its own order: row i repeats once per line of its order
+    per_row = np.repeat(sizes, sizes)
+    left = np.repeat(np.arange(len(orders)), per_row)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+    right = np.repeat(np.repeat(starts, sizes), per_row) + offsets
+    distinct = left != right
+    span = int(products.max()) + 1
+    keys, counts = np.unique(products[left[distinct]] * span + products[right[distinct]], return_counts=True)
+    return list(zip((keys // span).tolist(), (keys % span).tolist(), counts.tolist()))
+
+
+class CoPurchaseIndex:
+    def __init__(self, db, order_model, item_model, pair_model, recommendation_model, watermark_model,
+                 top_n=8, batch_orders=5000, settle_seconds=30):
+        self.db = db
+        self.Order = order_model
+        self.OrderItem = item_model
+        self.Pair = pair_model
+        self.Recommendation = recommendation_model
+        self.Watermark = watermark_model
+        self.top_n = top_n
+        self.batch_orders = batch_orders
+        # Orders younger than this are left for the next run, so a checkout that got a lower id
+        # but committed later than its neighbours is not skipped by the watermark
+        self.settle_seconds = settle_seconds
+
+    def related(self, product_id):
+        """Ids of the products most often bought with product_id, best first"""
+        row = self.db.session.get(self.Recommendation, product_id)
+        return json.loads(row.related) if row else []
+
+    def _insert(self, model):
+        dialect = self.db.session.get_bind().dialect.name
+        return (postgresql if dialect == 'postgresql' else sqlite).insert(model.__table__)
+
+    def _watermark(self):
+        session = self.db.session
+        session.execute(self._insert(self.Watermark).values(name=WATERMARK, last_id=0)
+                        .on_conflict_do_nothing(index_elements=['name']))
+        return session.execute(
+            select(self.Watermark.last_id).where(self.Watermark.name == WATERMARK)
+        ).scalar_one()
+
+    def _advance(self, last_id, new_id):
+        """Move the watermark; False if another worker moved it first"""
+        return self.db.session.execute(
+            update(self.Watermark)
+            .where(self.Watermark.name == WATERMARK, self.Watermark.last_id == last_id)
+            .values(last_id=new_id, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+
+    def update(self, full=False):
+        """Fold orders past the watermark into the index; returns (orders read, products refreshed)"""
+        Order, OrderItem, session = self.Order, self.OrderItem, self.db.session
+        if full:
+            session.execute(delete(self.Pair))
+            session.execute(delete(self.Recommendation))
+            session.execute(delete(self.Watermark).where(self.Watermark.name == WATERMARK))
+        last_id = self._watermark()
+        session.commit()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.settle_seconds)
+        settled = (Order.id > last_id) & (Order.created_at <= cutoff)
+        read = 0
+        touched = set()
+        while True:
+            batch_end = session.execute(
+                select(func.max(Order.id)).where(Order.id.in_(
+                    select(Order.id).where(settled).order_by(Order.id).limit(self.batch_orders)
+                ))
+            ).scalar()
+            if batch_end is None:
+                break
+            if not self._advance(last_id, batch_end):
+                session.rollback()
+                break
+            rows = session.execute(
+                select(OrderItem.order_id, OrderItem.product_id).distinct()
+                .join(Order, Order.id == OrderItem.order_id)
+                .where(settled, Order.id <= batch_end)
+                .order_by(OrderItem.order_id)
+            ).all()
+            pairs = co_occurrences([r[0] for r in rows], [r[1] for r in rows])
+            self._add_pairs(pairs)
+            session.commit()
+            read += len({r[0] for r in rows})
+            touched.update(a for a, _, _ in pairs)
+            last_id = batch_end
+            settled = (Order.id > last_id) & (Order.created_at <= cutoff)
+        self.refresh(touched)
+        return read, len(touched)
+
+    def _add_pairs(self, pairs, chunk=1000):
+        stmt = self._insert(self.Pair)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['product_id', 'other_id'],
+            set_={'orders': self.Pair.__table__.c.orders + stmt.excluded.orders}
+        )
+        for i in range(0, len(pairs), chunk):
+            self.db.session.execute(stmt, [
+                {'product_id': a, 'other_id': b, 'orders': n} for a, b, n in pairs[i:i + chunk]
+            ])
+
+    def refresh(self, product_ids, chunk=500):
+        """Rewrite the recommendation rows of product_ids from their pair counts"""
+        Pair, session = self.Pair, self.db.session
+        product_ids = sorted(product_ids)
+        stmt = self._insert(self.Recommendation)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['product_id'],
+            set_={'related': stmt.excluded.related, 'updated_at': stmt.excluded.updated_at}
+        )
+        for i in range(0, len(product_ids), chunk):
+            rank = func.row_number().over(
+                partition_by=Pair.product_id, order_by=(Pair.orders.desc(), Pair.other_id)
+            ).label('rank')
+            ranked = select(Pair.product_id, Pair.other_id, rank) \
+                .where(Pair.product_id.in_(product_ids[i:i + chunk])).subquery()
+            related = {}
+            for product_id, other_id in session.execute(
+                select(ranked.c.product_id, ranked.c.other_id)
+                .where(ranked.c.rank <= self.top_n)
+                .order_by(ranked.c.product_id, ranked.c.rank)
+            ):
+                related.setdefault(product_id, []).append(other_id)
+            if not related:
+                continue
+            now = datetime.utcnow()
+            session.execute(stmt, [
+                {'product_id': product_id, 'related': json.dumps(ids), 'updated_at': now}
+                for product_id, ids in related.items()
+            ])
+            session.commit()
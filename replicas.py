@@ -0,0 +1,180 @@
+"""
+Read replica routing
+
+Replicas are Flask-SQLAlchemy binds named replica_0, replica_1, ... Views
+decorated with ReplicaRouter.reads send their SELECTs to one healthy
+replica, picked once per request; every other statement, and every
+statement of any other view, goes to the primary. A replica is skipped
+while it is unreachable or more than max_lag seconds behind (measured on
+PostgreSQL; other databases cannot report lag and count as current). A
+background thread in each worker probes the replicas every check_interval
+seconds, so requests only read the last result and never wait on a slow
+replica's connect timeout; until the first probe answers, reads go to the
+primary, as they do when the last answer is more than three intervals old.
+A client that has just written anything reads from the primary for
+sticky_seconds afterwards so it sees its own cart, order or edit. Code
+inside ReplicaRouter.primary() always reads from the primary; the app uses
+it for catalog cache misses, so an entry shared with every request is
+never filled from a replica that is behind an invalidation.
+"""
+
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_app_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.sql import Select
+
+PRIMARY_UNTIL_KEY = '_read_primary_until'
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+# Seconds of replay lag; 0 when the server is not a standby or has replayed everything it received
+POSTGRES_LAG_SQL = text(
+    'SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 '
+    'WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+)
+
+
+def replica_urls(value):
+    """{'replica_0': url, ...} from a comma-separated list of replica database URLs"""
+    urls = [u.strip() for u in value.split(',') if u.strip()]
+    return {f'replica_{n}': url.replace('postgres://', 'postgresql://', 1) if url.startswith('postgres://') else url
+            for n, url in enumerate(urls)}
+
+
+class RoutingSession(Session):
+    """Session that sends plain SELECTs to the request's replica, if the router picked one"""
+
+    def __init__(self, db, router=None, **kwargs):
+        super().__init__(db, **kwargs)
+        self.router = router
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.router is not None and isinstance(clause, Select) \
+                and clause._for_update_arg is None and not self._flushing:
+            replica = self.router.current_replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    def __init__(self, max_lag=5.0, check_interval=5.0, sticky_seconds=10):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.sticky_seconds = sticky_seconds
+        self.db = None
+        self._health = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self.counters = {'replica_reads': 0, 'sticky_primary_reads': 0, 'fallback_primary_reads': 0}
+
+    def init_app(self, app, db):
+        self.db = db
+        app.after_request(self._remember_write)
+
+    def replica_names(self):
+        return sorted(key for key in self.db.engines if isinstance(key, str) and key.startswith('replica_'))
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _remember_write(self, response):
+        if request.method in WRITE_METHODS and response.status_code < 400 and self.replica_names():
+            session[PRIMARY_UNTIL_KEY] = time.time() + self.sticky_seconds
+        return response
+
+    def reads(self, view):
+        """Decorator for views that only read: their SELECTs may be served by a replica"""
+        @wraps(view)
+        def routed(*args, **kwargs):
+            g.replica_engine = self._choose()
+            return view(*args, **kwargs)
+        return routed
+
+    @contextmanager
+    def primary(self):
+        """Send the SELECTs issued inside the block to the primary, even in a reads view"""
+        if not has_app_context():
+            yield
+            return
+        replica = g.pop('replica_engine', None)
+        try:
+            yield
+        finally:
+            if replica is not None:
+                g.replica_engine = replica
+
+    def current_replica(self):
+        return g.get('replica_engine') if has_app_context() else None
+
+    def _choose(self):
+        names = self.replica_names()
+        if not names:
+            return None
+        if session.get(PRIMARY_UNTIL_KEY, 0) > time.time():
+            self._count('sticky_primary_reads')
+            return None
+        self._ensure_prober()
+        healthy = [name for name in names if self._is_healthy(name)]
+        if not healthy:
+            self._count('fallback_primary_reads')
+            return None
+        self._count('replica_reads')
+        return self.db.engines[random.choice(healthy)]
+
+    def _is_healthy(self, name):
+        checked_at, healthy, _ = self._health.get(name, (None, False, None))
+        # A probe stuck connecting to a dead replica must not leave its last good result standing
+        return healthy and time.monotonic() - checked_at < 3 * self.check_interval
+
+    def _ensure_prober(self):
+        # Started lazily and per process, so gunicorn workers forked from a preloaded app each get one
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            engines = {name: self.db.engines[name] for name in self.replica_names()}
+        threading.Thread(target=self._run_probes, args=(engines,), name='replica-prober', daemon=True).start()
+
+    def _run_probes(self, engines):
+        while True:
+            self.probe(engines)
+            time.sleep(self.check_interval)
+
+    def probe(self, engines):
+        """Measure every replica in {name: engine} and record whether it may serve reads"""
+        for name, engine in engines.items():
+            lag = self.lag(engine)
+            with self._lock:
+                self._health[name] = (time.monotonic(), lag is not None and lag <= self.max_lag, lag)
+
+    def lag(self, engine):
+        """Replication lag in seconds, 0.0 where it cannot be measured, None if unreachable"""
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name == 'postgresql':
+                    return float(conn.execute(POSTGRES_LAG_SQL).scalar() or 0)
+                conn.execute(text('SELECT 1'))
+                return 0.0
+        except Exception:
+            return None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            health = dict(self._health)
+        for name in self.replica_names():
+            _, healthy, lag = health.get(name, (None, False, None))
+            stats[f'{name}_healthy'] = int(healthy)
+            stats[f'{name}_lag_seconds'] = lag if lag is not None else -1
+        return stats
@@ -0,0 +1,140 @@
+"""
+Product full-text search backends
+
+SQLite uses an FTS5 virtual table kept in sync from the admin product
+routes, PostgreSQL uses a GIN index over a tsvector expression, and any
+other database falls back to LIKE matching.
+"""
+
+import re
+from sqlalchemy import text
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(term):
+    """Split a raw search string into lowercase word tokens"""
+    return [t.lower() for t in TOKEN_RE.findall(term or '')]
+
+
+class LikeSearchBackend:
+    """Fallback backend: unranked substring match on name and description"""
+
+    def __init__(self, db, product_model):
+        self.db = db
+        self.Product = product_model
+
+    def setup(self):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def index_product(self, product):
+        pass
+
+    def remove_product(self, product_id):
+        pass
+
+    def apply(self, query, term, ranked=True):
+        Product = self.Product
+        for token in tokenize(term):
+            pattern = f'%{token}%'
+            query = query.filter(self.db.or_(Product.name.ilike(pattern),
+                                             Product.description.ilike(pattern)))
+        return query
+
+
+class SQLiteFTSBackend(LikeSearchBackend):
+    """FTS5 index keyed by product id, ranked with bm25 (name weighted over description)"""
+
+    table = 'product_fts'
+
+    def setup(self):
+        with self.db.engine.begin() as conn:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"
+            ), {'name': self.table}).first()
+            if exists:
+                return
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {self.table} USING fts5("
+                f"name, description, tokenize='unicode61', prefix='2 3')"
+            ))
+            self._backfill(conn)
+
+    def rebuild(self):
+        with self.db.engine.begin() as conn:
+            conn.execute(text(f"DELETE FROM {self.table}"))
+            self._backfill(conn)
+
+    def _backfill(self, conn):
+        conn.execute(text(
+            f"INSERT INTO {self.table}(rowid, name, description) "
+            f"SELECT id, name, COALESCE(description, '') FROM product WHERE is_active = 1"
+        ))
+
+    def index_product(self, product):
+        """Upsert one product inside the caller's transaction (inactive products are dropped)"""
+        self.remove_product(product.id)
+        if product.is_active is not False:
+            self.db.session.execute(
+                text(f"INSERT INTO {self.table}(rowid, name, description) VALUES (:id, :name, :description)"),
+                {'id': product.id, 'name': product.name, 'description': product.description or ''}
+            )
+
+    def remove_product(self, product_id):
+        self.db.session.execute(text(f"DELETE FROM {self.table} WHERE rowid = :id"), {'id': product_id})
+
+    def apply(self, query, term, ranked=True):
+        tokens = tokenize(term)
+        if not tokens:
+            return query
+        match = ' '.join(f'"{t}"*' for t in tokens)
+        fts = self.db.table(self.table, self.db.column('rowid'))
+        query = (query.join(fts, fts.c.rowid == self.Product.id)
+                      .filter(text(f"{self.table} MATCH :match").bindparams(match=match)))
+        return query.order_by(text(f"bm25({self.table}, 10.0, 1.0)")) if ranked else query
+
+
+class PostgresSearchBackend(LikeSearchBackend):
+    """GIN expression index over to_tsvector; PostgreSQL maintains it on every write"""
+
+    index = 'ix_product_search'
+    config = 'simple'
+
+    def _document(self, prefix=''):
+        return (f"setweight(to_tsvector('{self.config}', coalesce({prefix}name, '')), 'A') || "
+                f"setweight(to_tsvector('{self.config}', coalesce({prefix}description, '')), 'B')")
+
+    def setup(self):
+        with self.db.engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {self.index} ON product USING GIN (({self._document()}))"
+            ))
+
+    def apply(self, query, term, ranked=True):
+        tokens = tokenize(term)
+        if not tokens:
+            return query
+        tsquery = ' & '.join(f'{t}:*' for t in tokens)
+        document = self._document(prefix='product.')
+        query = query.filter(text(f"({document}) @@ to_tsquery('{self.config}', :tsquery)")
+                             .bindparams(tsquery=tsquery))
+        if not ranked:
+            return query
+        return query.order_by(text(f"ts_rank(({document}), to_tsquery('{self.config}', :tsquery)) DESC")
+                              .bindparams(tsquery=tsquery))
+
+
+def create_search_backend(db, product_model):
+    """Pick the search backend matching the configured database dialect"""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        backend = SQLiteFTSBackend(db, product_model)
+    elif dialect == 'postgresql':
+        backend = PostgresSearchBackend(db, product_model)
+    else:
+        backend = LikeSearchBackend(db, product_model)
+    backend.setup()
+    return backend
@@ -0,0 +1,92 @@
+"""
+JSON API for the mobile app: session, catalog and cart
+
+Run from the repository root: python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import unittest
+
+_db_dir = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir.name, 'test.db')}"
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import app, db, User, Category, Product, catalog_cache  # noqa: E402
+
+
+class ApiTest(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        catalog_cache.invalidate()
+        user = User(username='customer', email='customer@example.com', full_name='Customer',
+                    password_hash=generate_password_hash('secret'))
+        category = Category(name='Fruit')
+        db.session.add_all([user, category])
+        db.session.flush()
+        apple = Product(name='Apple', price=10.0, stock=5, category_id=category.id)
+        pear = Product(name='Pear', price=20.0, stock=1, category_id=category.id)
+        db.session.add_all([apple, pear])
+        db.session.commit()
+        self.apple, self.pear = apple.id, pear.id
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def login(self):
+        response = self.client.post('/api/v1/session', json={'username': 'customer', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_rejects_a_wrong_password(self):
+        response = self.client.post('/api/v1/session', json={'username': 'customer', 'password': 'nope'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.get('/api/v1/cart').status_code, 401)
+
+    def test_products_by_ids_keep_the_order_and_report_missing(self):
+        response = self.client.get(f'/api/v1/products?ids={self.pear},999,{self.apple},{self.pear}')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual([p['id'] for p in body['products']], [self.pear, self.apple])
+        self.assertEqual(body['missing'], [999])
+        self.assertEqual(self.client.get('/api/v1/products?ids=1,x').status_code, 400)
+
+    def test_catalog_responses_are_conditional(self):
+        first = self.client.get('/api/v1/categories')
+        self.assertEqual(first.status_code, 200)
+        again = self.client.get('/api/v1/categories', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    def test_cart_batch_add_set_and_remove(self):
+        self.login()
+        response = self.client.post('/api/v1/cart/items', json={'items': [
+            {'product_id': self.apple, 'quantity': 2}, {'product_id': self.apple, 'quantity': 1},
+            {'product_id': self.pear}]})
+        self.assertEqual(response.status_code, 200)
+        lines = {i['product_id']: i['quantity'] for i in response.get_json()['items']}
+        self.assertEqual(lines, {self.apple: 3, self.pear: 1})
+        self.assertEqual(response.get_json()['subtotal'], 50.0)
+
+        response = self.client.put(f'/api/v1/cart/items/{self.apple}', json={'quantity': 5})
+        self.assertEqual({i['product_id']: i['quantity'] for i in response.get_json()['items']},
+                         {self.apple: 5, self.pear: 1})
+        response = self.client.put(f'/api/v1/cart/items/{self.pear}', json={'quantity': 0})
+        self.assertEqual([i['product_id'] for i in response.get_json()['items']], [self.apple])
+
+    def test_cart_add_beyond_stock_changes_nothing(self):
+        self.login()
+        response = self.client.post('/api/v1/cart/items', json={'items': [
+            {'product_id': self.apple, 'quantity': 1}, {'product_id': self.pear, 'quantity': 2}]})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([(i['product_id'], i['reason']) for i in response.get_json()['items']],
+                         [(self.pear, 'out_of_stock')])
+        self.assertEqual(self.client.get('/api/v1/cart').get_json()['items'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
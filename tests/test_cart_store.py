@@ -0,0 +1,108 @@
+"""
+Write-behind carts and checkout
+
+Run from the repository root: python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+
+_db_dir = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir.name, 'test.db')}"
+
+import app as store  # noqa: E402
+from app import app, db, User, Category, Product, Order, Cart  # noqa: E402
+from cart_store import MemoryCartBackend, WriteBehindCartStore  # noqa: E402
+
+
+class WriteBehindCheckoutTest(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        user = User(username='customer', email='customer@example.com', password_hash='x', full_name='Customer')
+        category = Category(name='Fruit')
+        db.session.add_all([user, category])
+        db.session.flush()
+        product = Product(name='Apple', price=10.0, stock=10, category_id=category.id)
+        db.session.add(product)
+        db.session.commit()
+        self.user_id, self.product_id = user.id, product.id
+
+        self.backend = MemoryCartBackend()
+        self.carts = WriteBehindCartStore(self.backend, db.engine, Cart, Product, flush_interval=3600)
+        # Keep the background flusher out of the way; tests call flush_dirty() themselves
+        self.carts._ensure_flusher = lambda: None
+        self.original_store, store.cart_store = store.cart_store, self.carts
+        self.client = app.test_client()
+        with self.client.session_transaction() as s:
+            s['user_id'] = self.user_id
+
+    def tearDown(self):
+        store.cart_store = self.original_store
+        db.session.remove()
+        self.ctx.pop()
+
+    def table_cart(self):
+        db.session.expire_all()
+        return {c.product_id: c.quantity for c in Cart.query.filter_by(user_id=self.user_id)}
+
+    def test_changes_reach_the_table_on_flush(self):
+        self.carts.add(self.user_id, {self.product_id: 2})
+        self.assertEqual(self.table_cart(), {})
+        self.assertEqual(self.carts.flush_dirty(), 1)
+        self.assertEqual(self.table_cart(), {self.product_id: 2})
+
+    def test_viewing_checkout_keeps_the_cart_in_the_store(self):
+        self.carts.add(self.user_id, {self.product_id: 2})
+        response = self.client.get('/checkout')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.backend.get(self.user_id), {self.product_id: 2})
+        self.assertEqual(self.table_cart(), {})
+
+    def test_flusher_does_not_restore_a_checked_out_cart(self):
+        self.carts.add(self.user_id, {self.product_id: 2})
+        # A flusher in another worker picked the cart up just before checkout took it
+        self.assertEqual(self.backend.pop_dirty(10), [self.user_id])
+        response = self.client.post('/checkout', data={'shipping_address': '1 Main St', 'payment_method': 'COD'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.query.count(), 1)
+        self.backend.mark_dirty([self.user_id])
+        self.carts.flush_dirty()
+        self.assertEqual(self.table_cart(), {})
+        self.assertEqual(self.carts.items(self.user_id), {})
+        self.assertEqual(db.session.get(Product, self.product_id).stock, 8)
+
+    def test_flush_skips_a_cart_locked_by_checkout(self):
+        self.carts.add(self.user_id, {self.product_id: 2})
+        lock = self.backend.lock(self.user_id)
+        lock.acquire()
+        try:
+            self.assertEqual(self.carts.flush_dirty(), 0)
+            self.assertEqual(self.table_cart(), {})
+        finally:
+            lock.release()
+        # Left dirty for the next round
+        self.assertEqual(self.carts.flush_dirty(), 1)
+        self.assertEqual(self.table_cart(), {self.product_id: 2})
+
+    def test_checkout_waits_for_a_flush_in_progress(self):
+        self.carts.add(self.user_id, {self.product_id: 2})
+        lock = self.backend.lock(self.user_id)
+        lock.acquire()
+        done = threading.Event()
+        worker = threading.Thread(target=lambda: (self.carts.checkout(self.user_id), done.set()))
+        worker.start()
+        self.assertFalse(done.wait(0.2))
+        lock.release()
+        worker.join(5)
+        self.assertTrue(done.is_set())
+        self.assertIsNone(self.backend.get(self.user_id))
+        self.assertEqual(self.table_cart(), {self.product_id: 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
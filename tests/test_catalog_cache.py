@@ -0,0 +1,79 @@
+"""
+Catalog cache invalidation across workers
+
+Two CatalogCache instances stand in for two gunicorn workers.
+Run from the repository root: python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import unittest
+
+from cache import CatalogCache, LRUStore, MemorySharedStore
+
+
+class Loader:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {'version': self.calls}
+
+
+class VersionFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.dir.name, 'catalog_cache.version')
+        self.workers = [CatalogCache(local=LRUStore(), version_file=path) for _ in range(2)]
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_invalidation_reaches_the_other_worker_at_once(self):
+        first, second = self.workers
+        load = Loader()
+        self.assertEqual(second.get_or_set('categories', load), {'version': 1})
+        self.assertEqual(second.get_or_set('categories', load), {'version': 1})
+        first.invalidate()
+        self.assertEqual(second.get_or_set('categories', load), {'version': 2})
+        self.assertEqual(load.calls, 2)
+
+    def test_back_to_back_invalidations_each_move_the_version(self):
+        first = self.workers[0]
+        versions = set()
+        for _ in range(5):
+            first.invalidate()
+            versions.add(first.version())
+        self.assertEqual(len(versions), 5)
+
+
+class SharedVersionTest(unittest.TestCase):
+    def setUp(self):
+        shared = MemorySharedStore()
+        self.first = CatalogCache(local=LRUStore(), shared=shared)
+        self.second = CatalogCache(local=LRUStore(), shared=shared, version_ttl=0)
+
+    def test_version_is_read_once_per_interval(self):
+        reads = []
+        get = self.first.shared.get
+        self.first.shared.get = lambda key: reads.append(key) or get(key)
+        for _ in range(3):
+            self.first.version()
+        self.assertEqual(reads.count(CatalogCache.version_key), 1)
+
+    def test_invalidating_worker_sees_its_own_bump(self):
+        load = Loader()
+        self.first.get_or_set('categories', load)
+        self.first.invalidate()
+        self.assertEqual(self.first.get_or_set('categories', load), {'version': 2})
+
+    def test_other_worker_sees_the_bump_after_its_interval(self):
+        load = Loader()
+        self.second.get_or_set('categories', load)
+        self.first.invalidate()
+        self.assertEqual(self.second.get_or_set('categories', load), {'version': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
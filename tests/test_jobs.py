@@ -0,0 +1,115 @@
+"""
+Background job queue: idempotent enqueue, claiming, retries
+
+Run from the repository root: python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir.name, 'test.db')}"
+
+from app import app, db, BackgroundJob  # noqa: E402
+from jobs import JobQueue  # noqa: E402
+
+
+class JobQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        # A queue of our own, so the app's handlers stay untouched; retries are due at once
+        self.queue = JobQueue(db, BackgroundJob, retry_base=0)
+        self.handled = []
+        self.queue.handler('record')(self.handled.append)
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def jobs(self):
+        db.session.expire_all()
+        return BackgroundJob.query.order_by(BackgroundJob.id).all()
+
+    def test_same_key_is_queued_once(self):
+        for _ in range(3):
+            self.queue.enqueue('record', {'n': 1}, key='order-confirmation:1')
+            db.session.commit()
+        self.queue.enqueue('record', {'n': 2}, key='order-confirmation:2')
+        db.session.commit()
+        self.assertEqual([job.idempotency_key for job in self.jobs()],
+                         ['order-confirmation:1', 'order-confirmation:2'])
+
+    def test_a_rolled_back_enqueue_leaves_no_job(self):
+        self.queue.enqueue('record', {'n': 1}, key='order-confirmation:1')
+        db.session.rollback()
+        self.assertEqual(self.jobs(), [])
+
+    def test_a_claimed_job_is_not_claimed_again(self):
+        self.queue.enqueue('record', {'n': 1})
+        db.session.commit()
+        self.assertEqual(len(self.queue.claim('worker-a')), 1)
+        self.assertEqual(self.queue.claim('worker-b'), [])
+        job, = self.jobs()
+        self.assertEqual((job.status, job.locked_by, job.attempts), ('running', 'worker-a', 1))
+
+    def test_concurrent_workers_split_the_jobs(self):
+        for n in range(20):
+            self.queue.enqueue('record', {'n': n})
+        db.session.commit()
+        claimed = {}
+
+        def claim(worker_id):
+            with app.app_context():
+                claimed[worker_id] = [job.id for job in self.queue.claim(worker_id, limit=20)]
+
+        workers = [threading.Thread(target=claim, args=(f'worker-{n}',)) for n in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(10)
+        ids = [job_id for job_ids in claimed.values() for job_id in job_ids]
+        self.assertEqual(sorted(ids), [job.id for job in self.jobs()])
+
+    def test_an_abandoned_claim_is_reclaimed_and_the_late_result_ignored(self):
+        self.queue.enqueue('record', {'n': 1})
+        db.session.commit()
+        stale, = self.queue.claim('worker-a')
+        BackgroundJob.query.update({'locked_at': datetime.utcnow() - timedelta(seconds=self.queue.visibility_timeout + 1)})
+        db.session.commit()
+        fresh, = self.queue.claim('worker-b')
+        self.assertEqual(self.queue.run_job(fresh, 'worker-b'), 'done')
+        # worker-a wakes up and finishes too; its outcome must not overwrite worker-b's
+        self.queue.handler('record')(lambda payload: 1 / 0)
+        self.queue.run_job(stale, 'worker-a')
+        job, = self.jobs()
+        self.assertEqual((job.status, job.locked_by, job.attempts), ('done', 'worker-b', 2))
+
+    def test_failures_retry_then_give_up(self):
+        self.queue.handler('record')(lambda payload: 1 / 0)
+        self.queue.enqueue('record', {'n': 1}, max_attempts=2)
+        db.session.commit()
+        self.assertEqual(self.queue.run_once('worker-a'), 1)
+        job, = self.jobs()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('ZeroDivisionError', job.last_error)
+        self.assertEqual(self.queue.run_once('worker-a'), 1)
+        job, = self.jobs()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(self.queue.run_once('worker-a'), 0)
+
+    def test_run_once_hands_the_payload_to_the_handler(self):
+        self.queue.enqueue('record', {'order_id': 7})
+        db.session.commit()
+        self.assertEqual(self.queue.run_once('worker-a'), 1)
+        self.assertEqual(self.handled, [{'order_id': 7}])
+        self.assertEqual(self.jobs()[0].status, 'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+"""
+Keyset cursors: encoding round-trips and walking every page
+
+Run from the repository root: python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir.name, 'test.db')}"
+
+from flask import template_rendered  # noqa: E402
+
+from app import (app, db, User, Category, Product, Order, encode_cursor, decode_cursor,  # noqa: E402
+                 catalog_cache, ADMIN_ORDERS_PER_PAGE, MY_ORDERS_PER_PAGE, PRODUCTS_PER_PAGE)
+
+
+@contextmanager
+def rendered():
+    """Collect the context of every template rendered inside the block"""
+    contexts = []
+
+    def record(sender, template, context, **extra):
+        contexts.append(context)
+
+    template_rendered.connect(record, app)
+    try:
+        yield contexts
+    finally:
+        template_rendered.disconnect(record, app)
+
+
+class CursorRoundTripTest(unittest.TestCase):
+    def test_datetime(self):
+        created_at = datetime(2024, 3, 1, 12, 30, 45, 123456)
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 42)), (created_at, 42))
+
+    def test_price(self):
+        self.assertEqual(decode_cursor(encode_cursor(12.5, 7), float), (12.5, 7))
+
+    def test_name_containing_the_separator(self):
+        self.assertEqual(decode_cursor(encode_cursor('green_tea_bags', 3), str), ('green_tea_bags', 3))
+
+    def test_malformed_cursors(self):
+        for cursor in (None, '', 'abc', 'notadate_5', '2024-03-01T12:00:00_x'):
+            self.assertIsNone(decode_cursor(cursor), cursor)
+
+
+class PageWalkTest(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        catalog_cache.invalidate()
+        self.customer = User(username='customer', email='customer@example.com', password_hash='x', full_name='Customer')
+        self.admin = User(username='admin', email='admin@example.com', password_hash='x', full_name='Admin',
+                          is_admin=True)
+        db.session.add_all([self.customer, self.admin])
+        db.session.commit()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def login(self, user):
+        with self.client.session_transaction() as s:
+            s['user_id'] = user.id
+
+    def add_orders(self, count, user):
+        # Groups of five share a timestamp, so pages must break ties on id
+        start = datetime(2024, 1, 1)
+        db.session.add_all([
+            Order(user_id=user.id, total_amount=100.0, shipping_address='1 Main St', payment_method='COD',
+                  status='Pending', created_at=start + timedelta(minutes=n // 5))
+            for n in range(count)
+        ])
+        db.session.commit()
+        return [o.id for o in Order.query.order_by(Order.created_at.desc(), Order.id.desc())]
+
+    def walk(self, url, items_key, **params):
+        """Ids on every page reached by following next_cursor from the first page"""
+        ids, cursor, pages = [], None, 0
+        while True:
+            with rendered() as contexts:
+                response = self.client.get(url, query_string=dict(params, cursor=cursor) if cursor else params)
+            self.assertEqual(response.status_code, 200)
+            context = contexts[-1]
+            ids += [item['id'] if isinstance(item, dict) else item.id for item in context[items_key]]
+            pages += 1
+            cursor = context['next_cursor']
+            if not cursor:
+                return ids, pages
+
+    def test_admin_orders_visits_every_order_once(self):
+        expected = self.add_orders(2 * ADMIN_ORDERS_PER_PAGE + 7, self.customer)
+        self.login(self.admin)
+        ids, pages = self.walk('/admin/orders', 'orders')
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_my_orders_pages_through_only_the_customers_orders(self):
+        self.add_orders(5, self.admin)
+        self.add_orders(3 * MY_ORDERS_PER_PAGE + 2, self.customer)
+        expected = [o.id for o in Order.query.filter_by(user_id=self.customer.id)
+                    .order_by(Order.created_at.desc(), Order.id.desc())]
+        self.login(self.customer)
+        ids, pages = self.walk('/my_orders', 'orders')
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 4)
+
+    def test_products_every_sort_visits_every_product_once(self):
+        category = Category(name='Fruit')
+        db.session.add(category)
+        db.session.flush()
+        count = 2 * PRODUCTS_PER_PAGE + 5
+        # Prices, names and dates repeat, so every sort has ties across page boundaries
+        db.session.add_all([
+            Product(name=f'Apple {n % 4}', price=float(10 + n % 3), stock=5, category_id=category.id,
+                    created_at=datetime(2024, 1, 1) + timedelta(days=n % 6))
+            for n in range(count)
+        ])
+        db.session.commit()
+        products = Product.query.all()
+        orders = {
+            'newest': sorted(products, key=lambda p: (p.created_at, p.id), reverse=True),
+            'price_asc': sorted(products, key=lambda p: (p.price, p.id)),
+            'price_desc': sorted(products, key=lambda p: (p.price, p.id), reverse=True),
+            'name': sorted(products, key=lambda p: (p.name, p.id)),
+        }
+        for sort, expected in orders.items():
+            ids, pages = self.walk('/products', 'products', sort=sort)
+            self.assertEqual(ids, [p.id for p in expected], sort)
+            self.assertEqual(pages, 3, sort)
+
+    def test_products_cursor_keeps_the_filters(self):
+        category, other = Category(name='Fruit'), Category(name='Dairy')
+        db.session.add_all([category, other])
+        db.session.flush()
+        db.session.add_all([
+            Product(name=f'Apple {n}', price=5.0, stock=n % 2, category_id=(category if n % 3 else other).id)
+            for n in range(4 * PRODUCTS_PER_PAGE)
+        ])
+        db.session.commit()
+        expected = sorted(p.id for p in Product.query.filter(Product.category_id == category.id, Product.stock > 0))
+        ids, pages = self.walk('/products', 'products', sort='price_asc', category=category.id, in_stock='1')
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Sales rollups follow order cancellations
+
+Run from the repository root: python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir.name, 'test.db')}"
+
+from app import (app, db, User, Category, Product, Order, OrderItem,  # noqa: E402
+                 SalesDaily, SalesDailyProduct, sales_rollup)
+
+
+class CancelledOrderRollupTest(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        customer = User(username='customer', email='customer@example.com', password_hash='x', full_name='Customer')
+        admin = User(username='admin', email='admin@example.com', password_hash='x', full_name='Admin',
+                     is_admin=True)
+        category = Category(name='Fruit')
+        db.session.add_all([customer, admin, category])
+        db.session.flush()
+        product = Product(name='Apple', price=130.0, stock=10, category_id=category.id)
+        db.session.add(product)
+        db.session.flush()
+        # Old enough to be past the rollup's settle window
+        order = Order(user_id=customer.id, total_amount=260.0, shipping_address='1 Main St',
+                      payment_method='COD', status='Pending', created_at=datetime.utcnow() - timedelta(hours=1))
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(OrderItem(order_id=order.id, product_id=product.id, quantity=2, price=130.0))
+        db.session.commit()
+        self.customer_id, self.admin_id, self.order_id = customer.id, admin.id, order.id
+        self.product_id = product.id
+        self.day = order.created_at.date()
+        self.assertEqual(sales_rollup.update(), 1)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def login(self, user_id):
+        with self.client.session_transaction() as s:
+            s['user_id'] = user_id
+
+    def daily(self):
+        db.session.expire_all()
+        row = db.session.get(SalesDaily, self.day)
+        return (row.orders, row.units, row.revenue) if row else (0, 0, 0)
+
+    def product_units(self):
+        return sum(row.units for row in SalesDailyProduct.query.filter_by(day=self.day))
+
+    def test_customer_cancel_removes_order_from_rollups(self):
+        self.assertEqual(self.daily(), (1, 2, 260.0))
+        self.login(self.customer_id)
+        self.client.post(f'/cancel_order/{self.order_id}')
+        self.assertEqual(db.session.get(Order, self.order_id).status, 'Cancelled')
+        self.assertEqual(self.daily(), (0, 0, 0.0))
+        self.assertEqual(self.product_units(), 0)
+
+    def test_reinstating_a_cancelled_order_counts_it_once(self):
+        self.login(self.customer_id)
+        self.client.post(f'/cancel_order/{self.order_id}')
+        self.login(self.admin_id)
+        self.client.post(f'/admin/update_order_status/{self.order_id}', data={'status': 'Pending'})
+        self.assertEqual(db.session.get(Order, self.order_id).status, 'Pending')
+        self.assertEqual(self.daily(), (1, 2, 260.0))
+        self.assertEqual(self.product_units(), 2)
+
+    def test_cancel_while_a_rollup_holds_its_claim(self):
+        order = Order(user_id=self.customer_id, total_amount=130.0, shipping_address='1 Main St',
+                      payment_method='COD', status='Pending', created_at=datetime.utcnow() - timedelta(hours=1))
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(OrderItem(order_id=order.id, product_id=self.product_id, quantity=1, price=130.0))
+        db.session.commit()
+        order_id = order.id
+
+        # Pause update() after it has moved the watermark past the new order but before it commits
+        claimed, resume = threading.Event(), threading.Event()
+        read_lines = sales_rollup._lines
+
+        def paused_lines(connection, orders):
+            claimed.set()
+            resume.wait(5)
+            return read_lines(connection, orders)
+
+        def roll_up():
+            with app.app_context():
+                sales_rollup.update()
+
+        sales_rollup._lines = paused_lines
+        try:
+            rollup = threading.Thread(target=roll_up)
+            rollup.start()
+            self.assertTrue(claimed.wait(5))
+        finally:
+            sales_rollup._lines = read_lines
+        self.login(self.customer_id)
+        cancel = threading.Thread(target=lambda: self.client.post(f'/cancel_order/{order_id}'))
+        cancel.start()
+        # The cancellation has to wait for the claim; the rollup reads the order while it is still Pending
+        time.sleep(0.2)
+        resume.set()
+        rollup.join(10)
+        cancel.join(10)
+
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Order, order_id).status, 'Cancelled')
+        self.assertEqual(self.daily(), (1, 2, 260.0))
+        self.assertEqual(self.product_units(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
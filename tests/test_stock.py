@@ -0,0 +1,101 @@
+"""
+Stock reservation and release
+
+Run from the repository root: python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+
+_db_dir = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir.name, 'test.db')}"
+
+from app import app, db, User, Category, Product, Order, Cart, reserve_stock, release_stock  # noqa: E402
+
+
+class StockReservationTest(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        category = Category(name='Fruit')
+        db.session.add(category)
+        db.session.flush()
+        apple = Product(name='Apple', price=10.0, stock=5, category_id=category.id)
+        pear = Product(name='Pear', price=20.0, stock=2, category_id=category.id)
+        db.session.add_all([apple, pear])
+        db.session.commit()
+        self.apple, self.pear = apple.id, pear.id
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def stock(self):
+        db.session.expire_all()
+        return {p.id: p.stock for p in Product.query}
+
+    def test_reserve_takes_every_line(self):
+        self.assertTrue(reserve_stock({self.apple: 3, self.pear: 2}))
+        db.session.commit()
+        self.assertEqual(self.stock(), {self.apple: 2, self.pear: 0})
+
+    def test_one_short_line_reserves_nothing(self):
+        self.assertFalse(reserve_stock({self.apple: 3, self.pear: 3}))
+        db.session.rollback()
+        self.assertEqual(self.stock(), {self.apple: 5, self.pear: 2})
+
+    def test_missing_product_reserves_nothing(self):
+        self.assertFalse(reserve_stock({self.apple: 1, self.pear + 100: 1}))
+        db.session.rollback()
+        self.assertEqual(self.stock(), {self.apple: 5, self.pear: 2})
+
+    def test_release_puts_stock_back(self):
+        self.assertTrue(reserve_stock({self.apple: 4, self.pear: 1}))
+        db.session.commit()
+        release_stock({self.apple: 4, self.pear: 1})
+        db.session.commit()
+        self.assertEqual(self.stock(), {self.apple: 5, self.pear: 2})
+
+    def test_concurrent_reservations_never_oversell(self):
+        results = []
+
+        def buy():
+            with app.app_context():
+                won = reserve_stock({self.pear: 1})
+                if won:
+                    db.session.commit()
+                else:
+                    db.session.rollback()
+                results.append(won)
+
+        threads = [threading.Thread(target=buy) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(sorted(results), [False, False, False, True, True])
+        self.assertEqual(self.stock()[self.pear], 0)
+
+    def test_checkout_of_a_short_cart_places_no_order(self):
+        user = User(username='customer', email='customer@example.com', password_hash='x', full_name='Customer')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all([Cart(user_id=user.id, product_id=self.apple, quantity=1),
+                            Cart(user_id=user.id, product_id=self.pear, quantity=3)])
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s['user_id'] = user.id
+        response = client.post('/checkout', data={'shipping_address': '1 Main St', 'payment_method': 'COD'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.query.count(), 0)
+        self.assertEqual(self.stock(), {self.apple: 5, self.pear: 2})
+        self.assertEqual(Cart.query.filter_by(user_id=user.id).count(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
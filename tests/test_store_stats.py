@@ -0,0 +1,86 @@
+"""
+Dashboard counters kept by the ORM listeners match a full recount
+
+Run from the repository root: python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir.name, 'test.db')}"
+
+from app import (app, db, User, Category, Product, Order, StoreStat, DailyOrderStat,  # noqa: E402
+                 rebuild_store_stats)
+
+
+class StoreStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        self.customer = User(username='customer', email='customer@example.com', password_hash='x', full_name='C')
+        self.admin = User(username='admin', email='admin@example.com', password_hash='x', full_name='A',
+                          is_admin=True)
+        category = Category(name='Fruit')
+        db.session.add_all([self.customer, self.admin, category])
+        db.session.flush()
+        db.session.add_all([Product(name=f'Apple {n}', price=10.0, stock=5, category_id=category.id)
+                            for n in range(3)])
+        now = datetime.utcnow()
+        self.orders = [
+            Order(user_id=self.customer.id, total_amount=100.0 * (n + 1), shipping_address='1 Main St',
+                  payment_method='COD', status='Pending', created_at=now - timedelta(days=n % 2))
+            for n in range(4)
+        ]
+        db.session.add_all(self.orders)
+        db.session.commit()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def counters(self):
+        db.session.expire_all()
+        stats = {s.name: s.value for s in StoreStat.query if s.value}
+        daily = {d.day: (d.orders, d.revenue) for d in DailyOrderStat.query if d.orders}
+        return stats, daily
+
+    def assert_matches_recount(self):
+        incremental = self.counters()
+        rebuild_store_stats()
+        self.assertEqual(incremental, self.counters())
+        return incremental[0]
+
+    def test_inserts(self):
+        stats = self.assert_matches_recount()
+        self.assertEqual((stats['users'], stats['products'], stats['categories'], stats['orders']), (2, 3, 1, 4))
+        self.assertEqual(stats['revenue:Pending'], 1000.0)
+
+    def test_status_changes_and_deletes(self):
+        self.orders[0].status = 'Shipped'
+        db.session.commit()
+        db.session.delete(self.orders[1])
+        db.session.delete(Product.query.first())
+        db.session.commit()
+        stats = self.assert_matches_recount()
+        self.assertEqual((stats['orders'], stats['orders:Pending'], stats['orders:Shipped']), (3, 2, 1))
+        self.assertEqual(stats['products'], 2)
+
+    def test_route_status_changes(self):
+        with self.client.session_transaction() as s:
+            s['user_id'] = self.customer.id
+        self.client.post(f'/cancel_order/{self.orders[2].id}')
+        with self.client.session_transaction() as s:
+            s['user_id'] = self.admin.id
+        self.client.post(f'/admin/update_order_status/{self.orders[3].id}', data={'status': 'Delivered'})
+        stats = self.assert_matches_recount()
+        self.assertEqual((stats['orders:Cancelled'], stats['orders:Delivered'], stats['orders:Pending']), (1, 1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()